@@ -1,114 +1,24 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import sqlite3
-import hashlib
-from datetime import datetime
-from db_setup import setup_db
-import pandas as pd
-from io import StringIO
-
-# Language mapping
-language_options = ["English", "Hindi", "Kannada"]
-language_map = {
-    "English": {
-        "menu": "Menu",
-        "login": "Login",
-        "register": "Register",
-        "create_account": "Create Account",
-        "username": "Username",
-        "password": "Password",
-        "register_button": "Register",
-        "login_button": "Login",
-        "invalid_credentials": "Invalid credentials",
-        "welcome": "Welcome",
-        "soil_type": "Select Soil Type",
-        "no_soil_found": "No soil types found in database",
-        "crop": "Select Crop",
-        "no_crop_found": "No crops found for selected soil type",
-        "nutrient_levels": "Soil Nutrient Levels",
-        "nitrogen": "Nitrogen (kg/acre)",
-        "phosphorus": "Phosphorus (kg/acre)",
-        "potassium": "Potassium (kg/acre)",
-        "analyze_recommend": "Analyze & Recommend",
-        "reset": "Reset",
-        "analysis_results": "Analysis Results",
-        "recommended_inorganic": "Recommended Inorganic Fertilizers",
-        "recommended_organic": "Recommended Organic Fertilizers",
-        "download_results": "Download Results",
-        "excess_by": "Excess by",
-        "deficient_by": "Deficient by",
-        "balanced": "Balanced",
-        "no_nutrient_data": "No standard nutrient data found for this crop.",
-        "crop_determination_failed": "Could not determine the selected crop.",
-        "download_file_name": "soil_analysis_results",
-        "register_exists": "already exists",
-    },
-    "Hindi": {
-        "menu": "मेनू",
-        "login": "लॉगिन",
-        "register": "रजिस्टर",
-        "create_account": "खाता बनाएँ",
-        "username": "उपयोगकर्ता नाम",
-        "password": "पासवर्ड",
-        "register_button": "रजिस्टर करें",
-        "login_button": "लॉगिन करें",
-        "invalid_credentials": "अमान्य क्रेडेंशियल",
-        "welcome": "स्वागत है",
-        "soil_type": "मिट्टी का प्रकार चुनें",
-        "no_soil_found": "डेटाबेस में कोई मिट्टी का प्रकार नहीं मिला",
-        "crop": "फसल चुनें",
-        "no_crop_found": "चयनित मिट्टी के प्रकार के लिए कोई फसल नहीं मिली",
-        "nutrient_levels": "मिट्टी पोषक तत्व स्तर",
-        "nitrogen": "नाइट्रोजन (किलोग्राम/एकड़)",
-        "phosphorus": "फास्फोरस (किलोग्राम/एकड़)",
-        "potassium": "पोटेशियम (किलोग्राम/एकड़)",
-        "analyze_recommend": "विश्लेषण और सिफारिश करें",
-        "reset": "रीसेट",
-        "analysis_results": "विश्लेषण परिणाम",
-        "recommended_inorganic": "अनुशंसित अकार्बनिक उर्वरक",
-        "recommended_organic": "अनुशंसित कार्बनिक उर्वरक",
-        "download_results": "परिणाम डाउनलोड करें",
-        "excess_by": "से अधिक",
-        "deficient_by": "से कम",
-        "balanced": "संतुलित",
-        "no_nutrient_data": "इस फसल के लिए कोई मानक पोषक तत्व डेटा नहीं मिला।",
-        "crop_determination_failed": "चयनित फसल का निर्धारण नहीं किया जा सका।",
-        "download_file_name": "मृदा_विश्लेषण_परिणाम",
-        "register_exists": "पहले से मौजूद है",
-    },
-    "Kannada": {
-        "menu": "ಮೆನು",
-        "login": "ಲಾಗ್ ಇನ್",
-        "register": "ನೋಂದಾಯಿಸಿ",
-        "create_account": "ಖಾತೆ ರಚಿಸಿ",
-        "username": "ಬಳಕೆದಾರ ಹೆಸರು",
-        "password": "ಗುಪ್ತಪದ",
-        "register_button": "ನೋಂದಾಯಿಸಿ",
-        "login_button": "ಲಾಗ್ ಇನ್",
-        "invalid_credentials": "ಅಮಾನ್ಯ ರುಜುವಾತುಗಳು",
-        "welcome": "ಸ್ವಾಗತ",
-        "soil_type": "ಮಣ್ಣಿನ ಪ್ರಕಾರವನ್ನು ಆಯ್ಕೆ ಮಾಡಿ",
-        "no_soil_found": "ಡೇಟಾಬೇಸ್‌ನಲ್ಲಿ ಯಾವುದೇ ಮಣ್ಣಿನ ಪ್ರಕಾರಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
-        "crop": "ಬೆಳೆ ಆಯ್ಕೆ ಮಾಡಿ",
-        "no_crop_found": "ಆಯ್ಕೆ ಮಾಡಿದ ಮಣ್ಣಿನ ಪ್ರಕಾರಕ್ಕೆ ಯಾವುದೇ ಬೆಳೆಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
-        "nutrient_levels": "ಮಣ್ಣಿನ ಪೋಷಕಾಂಶಗಳ ಮಟ್ಟಗಳು",
-        "nitrogen": "ಸಾರಜನಕ (ಕೆಜಿ/ಎಕರೆ)",
-        "phosphorus": "ರಂಜಕ (ಕೆಜಿ/ಎಕರೆ)",
-        "potassium": "ಪೊಟ್ಯಾಸಿಯಮ್ (ಕೆಜಿ/ಎಕರೆ)",
-        "analyze_recommend": "ವಿಶ್ಲೇಷಿಸಿ ಮತ್ತು ಶಿಫಾರಸು ಮಾಡಿ",
-        "reset": "ಮರುಹೊಂದಿಸಿ",
-        "analysis_results": "ವಿಶ್ಲೇಷಣೆ ಫಲಿತಾಂಶಗಳು",
-        "recommended_inorganic": "ಶಿಫಾರಸು ಮಾಡಲಾದ ಅಜೈವಿಕ ಗೊಬ್ಬರಗಳು",
-        "recommended_organic": "ಶಿಫಾರಸು ಮಾಡಲಾದ ಸಾವಯವ ಗೊಬ್ಬರಗಳು",
-        "download_results": "ಫಲಿತಾಂಶಗಳನ್ನು ಡೌನ್‌ಲೋಡ್ ಮಾಡಿ",
-        "excess_by": "ಇಂದ ಹೆಚ್ಚುವರಿ",
-        "deficient_by": "ಇಂದ ಕೊರತೆ",
-        "balanced": "ಸಮತೋಲಿತ",
-        "no_nutrient_data": "ಈ ಬೆಳೆಗೆ ಯಾವುದೇ ಪ್ರಮಾಣಿತ ಪೋಷಕಾಂಶ ದತ್ತಾಂಶ ಕಂಡುಬಂದಿಲ್ಲ.",
-        "crop_determination_failed": "ಆಯ್ಕೆ ಮಾಡಿದ ಬೆಳೆಯನ್ನು ನಿರ್ಧರಿಸಲು ಸಾಧ್ಯವಾಗಲಿಲ್ಲ.",
-        "download_file_name": "ಮಣ್ಣಿನ_ವಿಶ್ಲೇಷಣೆ_ಫಲಿತಾಂಶಗಳು",
-        "register_exists": "ಈಗಾಗಲೇ ಅಸ್ತಿತ್ವದಲ್ಲಿದೆ",
-    },
-}
+import os
+import logging
+import functools
+import tempfile
+from datetime import date, datetime, timedelta
+import auth
+import db_pool
+import catalog
+import engine
+import history
+import metrics
+import reports
+from languages import language_map, language_options
+
+logger = logging.getLogger(__name__)
+
+# Usernames allowed to open the metrics page
+ADMIN_USERS = {name.strip() for name in os.environ.get("SOIL_ADMIN_USERS", "").split(",") if name.strip()}
 
 # Initialize session state
 def init_session_state():
@@ -118,12 +28,20 @@ def init_session_state():
         st.session_state.username = ""
     if 'user_id' not in st.session_state:
         st.session_state.user_id = None
+    if 'session_token' not in st.session_state:
+        st.session_state.session_token = None
     if 'analysis' not in st.session_state:
         st.session_state.analysis = None
-    if 'inorganic' not in st.session_state:
-        st.session_state.inorganic = []
-    if 'organic' not in st.session_state:
-        st.session_state.organic = []
+    if 'analysis_sample' not in st.session_state:
+        st.session_state.analysis_sample = None
+    if 'report_jobs' not in st.session_state:
+        st.session_state.report_jobs = []
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+    if 'pipeline' not in st.session_state:
+        st.session_state.pipeline = {}
+    if 'bulk_result' not in st.session_state:
+        st.session_state.bulk_result = None
     if 'language' not in st.session_state:
         st.session_state.language = "English"
 
@@ -136,291 +54,586 @@ st.session_state.language = selected_language
 lang = language_map[st.session_state.language]
 
 # Database connection
-def get_db_connection():
+@st.cache_resource
+def get_db_pool():
+    pool = db_pool.ConnectionPool()
+    metrics.register_collector("pool", lambda: {f"pool_{key}": value for key, value in pool.stats().items()})
+    return pool
+
+def get_pool_or_stop():
     try:
-        conn = setup_db()
-        return conn
+        return get_db_pool()
     except sqlite3.Error as e:
         st.error(f"Database connection failed: {e}")
         st.stop()
 
 # Authentication functions
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+@st.cache_resource
+def get_auth_service():
+    return auth.AuthService(get_db_pool())
+
+def get_auth_or_stop():
+    try:
+        return get_auth_service()
+    except sqlite3.Error as e:
+        st.error(f"Database connection failed: {e}")
+        st.stop()
 
 def register_user(username, password):
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (username, password) VALUES (?, ?)",
-            (username, hash_password(password))
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        st.error(lang["username"] + " " + lang["register_exists"])
+        with metrics.span("app.register_user"):
+            created = get_auth_or_stop().register_user(username, password)
+    except auth.AuthBusy:
+        st.sidebar.warning(lang["login_busy"])
         return False
-    finally:
-        conn.close()
+    if created:
+        return True
+    st.error(lang["username"] + " " + lang["register_exists"])
+    return False
 
 def verify_user(username, password):
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, username, password FROM users WHERE username = ?",
-            (username,)
-        )
-        user = cursor.fetchone()
-        if user and user[2] == hash_password(password):
-            st.session_state.user_id = user[0]
-            st.session_state.username = user[1]
-            st.session_state.logged_in = True
-            return True
-        return False
-    finally:
-        conn.close()
+    with metrics.span("app.verify_user"):
+        token = get_auth_or_stop().login(username, password)
+    if token:
+        st.session_state.session_token = token
+        restore_session()
+        st.session_state.history_cursors = [None]
+        return True
+    return False
+
+def restore_session():
+    # A cached token check per rerun; no query, no KDF
+    user = get_auth_or_stop().current_user(st.session_state.session_token) if st.session_state.session_token else None
+    if user:
+        st.session_state.user_id, st.session_state.username = user
+        st.session_state.logged_in = True
+    else:
+        st.session_state.session_token = None
+        st.session_state.user_id = None
+        st.session_state.username = ""
+        st.session_state.logged_in = False
+
+def logout():
+    if st.session_state.session_token:
+        get_auth_or_stop().logout(st.session_state.session_token)
+    st.session_state.session_token = None
+    restore_session()
 
 # Data retrieval
-def get_soil_types():
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, soil_name FROM soiltypes ORDER BY soil_name")
-        return [{"id": row[0], "soil_name": row[1]} for row in cursor.fetchall()]
-    finally:
-        conn.close()
+@st.cache_resource
+def get_catalog_cache():
+    return catalog.CatalogCache(get_db_pool())
 
-def get_crops_by_soil(soil_id):
-    conn = get_db_connection()
+def get_catalog():
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, crop_name FROM crops WHERE soil_id = ? ORDER BY crop_name",
-            (soil_id,)
-        )
-        return [{"id": row[0], "crop_name": row[1]} for row in cursor.fetchall()]
-    finally:
-        conn.close()
+        with metrics.span("app.get_catalog"):
+            return get_catalog_cache().get()
+    except sqlite3.Error as e:
+        st.error(f"Database connection failed: {e}")
+        st.stop()
 
-# Analysis functions
-standard_nutrients_list = [
-    {"nitrogen": 50, "phosphorus": 30, "potassium": 40},
-    {"nitrogen": 45, "phosphorus": 25, "potassium": 35},
-    {"nitrogen": 60, "phosphorus": 40, "potassium": 50},
-    {"nitrogen": 45, "phosphorus": 25, "potassium": 35},
-    {"nitrogen": 50, "phosphorus": 30, "potassium": 40},
-    {"nitrogen": 55, "phosphorus": 35, "potassium": 45},
-    {"nitrogen": 60, "phosphorus": 40, "potassium": 50},
-    {"nitrogen": 50, "phosphorus": 30, "potassium": 40},
-    {"nitrogen": 70, "phosphorus": 50, "potassium": 60},
-    {"nitrogen": 80, "phosphorus": 60, "potassium": 70},
-    {"nitrogen": 75, "phosphorus": 55, "potassium": 65},
-    {"nitrogen": 85, "phosphorus": 65, "potassium": 75},
-    {"nitrogen": 70, "phosphorus": 50, "potassium": 60},
-    {"nitrogen": 65, "phosphorus": 45, "potassium": 55},
-    {"nitrogen": 80, "phosphorus": 60, "potassium": 70},
-    {"nitrogen": 90, "phosphorus": 70, "potassium": 80},
-    {"nitrogen": 60, "phosphorus": 40, "potassium": 50},
-    {"nitrogen": 75, "phosphorus": 55, "potassium": 65},
-    {"nitrogen": 85, "phosphorus": 65, "potassium": 75},
-    {"nitrogen": 70, "phosphorus": 50, "potassium": 60},
-    {"nitrogen": 80, "phosphorus": 60, "potassium": 70},
-]
-
-def analyze_soil(crop_index, n, p, k):
-    if 0 <= crop_index < len(standard_nutrients_list):
-        std = standard_nutrients_list[crop_index]
-        return {
-            "Nitrogen": f"{lang['excess_by']} {n - std['nitrogen']:.2f}" if n > std["nitrogen"]
-            else f"{lang['deficient_by']} {std['nitrogen'] - n:.2f}" if n < std["nitrogen"] else lang["balanced"],
-            "Phosphorus": f"{lang['excess_by']} {p - std['phosphorus']:.2f}" if p > std["phosphorus"]
-            else f"{lang['deficient_by']} {std['phosphorus'] - p:.2f}" if p < std["phosphorus"] else lang["balanced"],
-            "Potassium": f"{lang['excess_by']} {k - std['potassium']:.2f}" if k > std["potassium"]
-            else f"{lang['deficient_by']} {std['potassium'] - k:.2f}" if k < std["potassium"] else lang["balanced"]
-        }
-    return None
-
-def recommend_fertilizer(crop_index, n, p, k):
-    if 0 <= crop_index < len(standard_nutrients_list):
-        std = standard_nutrients_list[crop_index]
-        deficiency = {
-            "nitrogen": max(0, std["nitrogen"] - n),
-            "phosphorus": max(0, std["phosphorus"] - p),
-            "potassium": max(0, std["potassium"] - k),
-        }
+def get_soil_types():
+    return get_catalog().soils
 
-        fertilizers = [
-            {"name": "Urea", "nitrogen": 46, "phosphorus": 0, "potassium": 0},
-            {"name": "DAP", "nitrogen": 18, "phosphorus": 46, "potassium": 0},
-            {"name": "MOP", "nitrogen": 0, "phosphorus": 0, "potassium": 60},
-        ]
-        organics = [
-            {"name": "Compost", "nitrogen": 2, "phosphorus": 1, "potassium": 1},
-            {"name": "Manure", "nitrogen": 1.5, "phosphorus": 1.2, "potassium": 0.8},
-        ]
-
-        inorganic = []
-        organic = []
-
-        for fert in fertilizers:
-            if fert["nitrogen"] > 0 and deficiency["nitrogen"]:
-                amount = (deficiency['nitrogen'] / fert['nitrogen']) * 100
-                inorganic.append(f"{fert['name']} for Nitrogen: {amount:.2f} kg")
-            if fert["phosphorus"] > 0 and deficiency["phosphorus"]:
-                amount = (deficiency['phosphorus'] / fert['phosphorus']) * 100
-                inorganic.append(f"{fert['name']} for Phosphorus: {amount:.2f} kg")
-            if fert["potassium"] > 0 and deficiency["potassium"]:
-                amount = (deficiency['potassium'] / fert['potassium']) * 100
-                inorganic.append(f"{fert['name']} for Potassium: {amount:.2f} kg")
-
-        for org in organics:
-            if org["nitrogen"] > 0 and deficiency["nitrogen"]:
-                amount = (deficiency['nitrogen'] / org['nitrogen']) * 100
-                organic.append(f"{org['name']} for Nitrogen: {amount:.2f} kg")
-            if org["phosphorus"] > 0 and deficiency["phosphorus"]:
-                amount = (deficiency['phosphorus'] / org['phosphorus']) * 100
-                organic.append(f"{org['name']} for Phosphorus: {amount:.2f} kg")
-            if org["potassium"] > 0 and deficiency["potassium"]:
-                amount = (deficiency['potassium'] / org['potassium']) * 100
-                organic.append(f"{org['name']} for Potassium: {amount:.2f} kg")
-
-        return inorganic, organic
-    return [], []
-
-def download_results(analysis_results, inorganic_recommendations, organic_recommendations):
-    now = datetime.now()
-    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
-    day = now.strftime("%A")
-    year = now.strftime("%Y")
-
-    results_text = f"Soil Analysis and Fertilizer Recommendation\n"
-    results_text += f"Date: {now.strftime('%Y-%m-%d')}\n"
-    results_text += f"Time: {now.strftime('%H:%M:%S')}\n"
-    results_text += f"Day: {day}\n"
-    results_text += f"Year: {year}\n\n"
-    results_text += "Analysis Results:\n"
-    if analysis_results:
-        for nutrient, status in analysis_results.items():
-            results_text += f"- {nutrient}: {status}\n"
-    else:
-        results_text += "No analysis performed.\n"
+def get_crops_by_soil(soil_id):
+    return get_catalog().crops_by_soil.get(soil_id, [])
 
-    results_text += "\nRecommended Inorganic Fertilizers:\n"
-    if inorganic_recommendations:
-        for recommendation in inorganic_recommendations:
-            results_text += f"- {recommendation}\n"
-    else:
-        results_text += "No inorganic fertilizer recommendations.\n"
+# Analysis functions
+@st.cache_resource
+def get_recommendation_cache():
+    cache = engine.RecommendationCache(maxsize=10_000)
+    metrics.register_collector(
+        "recommendation_cache", lambda: {f"recommendation_cache_{key}": value for key, value in cache.stats().items()}
+    )
+    return cache
+
+def recommend(crop_id, n, p, k):
+    # Structured and language-neutral; localized only when rendered
+    return engine.recommend(get_catalog(), crop_id, n, p, k, cache=get_recommendation_cache())
+
+# Reports
+@st.cache_resource
+def get_report_queue():
+    return reports.ReportQueue(reports.ReportCache())
+
+def build_report(key, fmt, render):
+    # Called only when the download is clicked; served from disk if already built
+    return get_report_queue().cache.read(key, fmt, render)
+
+def read_job_report(job_id):
+    # Rebuilt on the spot if the cache evicted the file after the job finished
+    return get_report_queue().read(job_id)
+
+# Analysis history
+@st.cache_resource
+def get_history_writer():
+    writer = history.AnalysisWriter(get_db_pool())
+    metrics.register_collector(
+        "history_writer", lambda: {f"history_writer_{key}": value for key, value in writer.stats.items()}
+    )
+    return writer
+
+# Sample archive
+@st.cache_resource
+def get_sample_archive():
+    import archive
+    return archive.SampleArchive()
+
+@st.cache_resource
+def get_archive_writer():
+    import archive
+    writer = archive.ArchiveWriter(get_sample_archive())
+    metrics.register_collector(
+        "archive_writer", lambda: {f"archive_writer_{key}": value for key, value in writer.stats.items()}
+    )
+    return writer
+
+def save_analysis(soil_id, crop_id, n, p, k, result, region=""):
+    # Queued for batched background writes; never blocks on SQLite or disk
+    with metrics.span("app.save_analysis"):
+        get_history_writer().record(st.session_state.user_id, soil_id, crop_id, n, p, k, result)
+        deficits = [max(0, -result["balance"][nutrient]) for nutrient in catalog.NUTRIENTS]
+        get_archive_writer().record(soil_id, crop_id, [n, p, k], deficits, region.strip())
+
+# Page pipeline
+def stage(name, inputs, compute):
+    """compute() for these inputs, reused until they change"""
+    cached = st.session_state.pipeline.get(name)
+    if cached is not None and cached[0] == inputs:
+        return cached[1]
+    value = compute()
+    st.session_state.pipeline[name] = (inputs, value)
+    return value
+
+def run_analysis(ref, soil_id, crop_id, n, p, k, region):
+    if crop_id not in ref.crops:
+        st.error(lang["crop_determination_failed"])
+        return
+    result = stage("analysis", (ref.version, crop_id, n, p, k), lambda: recommend(crop_id, n, p, k))
+    if not result:
+        st.warning(lang["no_nutrient_data"])
+        return
+    st.session_state.analysis = result
+    st.session_state.analysis_sample = {
+        "soil_id": soil_id, "crop_id": crop_id,
+        "nitrogen": n, "phosphorus": p, "potassium": k,
+        "created_at": datetime.now().isoformat(sep=" ", timespec="seconds"),
+        "result": result,
+    }
+    save_analysis(soil_id, crop_id, n, p, k, result, region)
+
+def reset_analysis():
+    st.session_state.analysis = None
+    st.session_state.analysis_sample = None
+
+def render_lines(result, language):
+    # Localized text for a result; only rebuilt for a new result or language
+    return {
+        "analysis": engine.format_analysis(result["balance"], language_map[language]),
+        "inorganic": engine.format_amounts(result["inorganic"]),
+        "organic": engine.format_amounts(result["organic"]),
+        "blend": engine.format_blend(result["blend"]) if result.get("blend") else [],
+    }
+
+def report_downloads(ref, sample, language):
+    # Content keys hash the whole sample, so build them once per sample
+    return [
+        (fmt,) + reports.sample_report(sample, ref, fmt, language, language_map[language])
+        for fmt in reports.available_formats()
+    ]
+
+def report_page_error(page, e):
+    # Log the traceback and count it rather than only showing the message
+    logger.exception("Unhandled error on the %s page", page)
+    metrics.inc("errors_total", {"page": page})
+    st.error(f"{lang['unexpected_error']} ({type(e).__name__})")
+
+def is_fragment_rerun():
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+# Pages
+@st.fragment
+def single_sample_page():
+    # Widget changes here rerun only this page, not the sidebar and login.
+    # Such reruns skip the main script, so account for them and catch errors here
+    started = metrics.start_rerun() if is_fragment_rerun() else None
+    try:
+        with metrics.span("fragment.single_sample"):
+            single_sample_form()
+    except Exception as e:
+        report_page_error("single_sample", e)
+    finally:
+        metrics.finish_rerun(started)
+
+def single_sample_form():
+    ref = get_catalog()
+    if not ref.soils:
+        st.error(lang["no_soil_found"])
+        return
+
+    soil_id = st.selectbox(
+        lang["soil_type"],
+        ref.soil_ids,
+        format_func=ref.soil_names.__getitem__
+    )
+
+    crop_ids = ref.crop_ids_by_soil.get(soil_id)
+    if not crop_ids:
+        st.error(lang["no_crop_found"])
+        return
+
+    crop_id = st.selectbox(
+        lang["crop"],
+        crop_ids,
+        format_func=ref.crop_name
+    )
+    region = st.text_input(lang["region"])
+
+    st.subheader(lang["nutrient_levels"])
+    n = st.number_input(lang["nitrogen"], min_value=0)
+    p = st.number_input(lang["phosphorus"], min_value=0)
+    k = st.number_input(lang["potassium"], min_value=0)
+
+    col1, col2, col3 = st.columns(3)
+    # Results render below in this same run, so no st.rerun() is needed
+    if col1.button(lang["analyze_recommend"]):
+        run_analysis(ref, soil_id, crop_id, n, p, k, region)
+    col2.button(lang["reset"], on_click=reset_analysis)
+
+    result = st.session_state.analysis
+    if not result:
+        return
+    language = st.session_state.language
+    lines = stage("lines", (result, language), lambda: render_lines(result, language))
+
+    st.subheader(lang["analysis_results"])
+    for nutrient, status in lines["analysis"].items():
+        st.write(f"{nutrient}: {status}")
+
+    # The blend covers all deficits at once, crediting e.g. DAP's nitrogen,
+    # so it is the recommendation; per-product amounts are alternatives
+    blend = result.get("blend")
+    if blend is not None:
+        st.subheader(lang["cheapest_blend"])
+        if blend["items"]:
+            for line in lines["blend"]:
+                st.write(line)
+            st.write(f"**{lang['blend_cost']}: ₹{blend['cost']:.2f}**")
+        else:
+            st.write(lang["no_blend_needed"])
+
+    with st.expander(lang["single_product_alternatives"], expanded=blend is None):
+        st.caption(lang["alternatives_note"])
+        st.markdown(f"**{lang['alternatives_inorganic']}**")
+        for fert in lines["inorganic"]:
+            st.write(fert)
+        st.markdown(f"**{lang['alternatives_organic']}**")
+        for fert in lines["organic"]:
+            st.write(fert)
+
+    sample = st.session_state.analysis_sample
+    if sample:
+        downloads = stage(
+            "downloads", (sample, ref.version, language), lambda: report_downloads(ref, sample, language)
+        )
+        for fmt, key, render in downloads:
+            col3.download_button(
+                label=f"{lang['download_results']} ({fmt.upper()})",
+                data=functools.partial(build_report, key, fmt, render),
+                file_name=f"{lang['download_file_name']}.{fmt}",
+                mime=reports.MIME_TYPES[fmt],
+                key=f"download_{fmt}",
+            )
+
+def show_older_history(cursor):
+    st.session_state.history_cursors.append(cursor)
+
+def show_newer_history():
+    if len(st.session_state.history_cursors) > 1:
+        st.session_state.history_cursors.pop()
+
+def history_page():
+    st.subheader(lang["history"])
+    # Make this user's queued saves visible before reading
+    with metrics.span("app.history_flush"):
+        get_history_writer().flush(timeout=2)
+    rows, next_cursor = history.fetch_history(
+        get_pool_or_stop(), st.session_state.user_id, before=st.session_state.history_cursors[-1]
+    )
+    if not rows:
+        st.info(lang["no_history"])
+        return
+
+    ref = get_catalog()
+    table = []
+    for row in rows:
+        analysis = engine.format_analysis(row["result"]["balance"], lang)
+        crop = ref.crops.get(row["crop_id"])
+        table.append({
+            lang["date"]: row["created_at"][:19],
+            lang["soil_column"]: ref.soil_names.get(row["soil_id"], row["soil_id"]),
+            lang["crop_column"]: crop["crop_name"] if crop else row["crop_id"],
+            lang["nitrogen"]: row["nitrogen"],
+            lang["phosphorus"]: row["phosphorus"],
+            lang["potassium"]: row["potassium"],
+            lang["analysis_results"]: "; ".join(f"{name}: {status}" for name, status in analysis.items()),
+        })
+    st.dataframe(table, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    col1.button(lang["newer"], on_click=show_newer_history,
+                disabled=len(st.session_state.history_cursors) == 1)
+    col2.button(lang["older"], on_click=show_older_history, args=(next_cursor,),
+                disabled=next_cursor is None)
+
+    season_report_section()
+
+def season_report_section():
+    st.subheader(lang["season_report"])
+    col1, col2, col3 = st.columns(3)
+    start = col1.date_input(lang["start_date"], date.today() - timedelta(days=180))
+    end = col2.date_input(lang["end_date"], date.today())
+    fmt = col3.selectbox(lang["report_format"], reports.available_formats(), format_func=str.upper)
+    everyone = is_admin() and st.checkbox(lang["all_users"])
+
+    if st.button(lang["generate_report"]):
+        ref = get_catalog()
+        key, render = reports.season_report(
+            get_pool_or_stop(), ref, fmt, st.session_state.language, lang,
+            user_id=None if everyone else st.session_state.user_id,
+            start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(),
+        )
+        try:
+            job_id = get_report_queue().submit(key, fmt, render, name=f"{start} – {end}")
+        except reports.ReportQueueFull:
+            st.warning(lang["report_busy"])
+        else:
+            jobs = st.session_state.report_jobs
+            if job_id not in jobs:
+                jobs.insert(0, job_id)
+                del jobs[5:]
+
+    if st.session_state.report_jobs:
+        queue = get_report_queue()
+        jobs = [queue.status(job_id) for job_id in st.session_state.report_jobs]
+        pending = any(job and job["state"] in ("queued", "running") for job in jobs)
+        # Poll only while something is still being built; the rest of the page is untouched
+        st.fragment(report_jobs_panel, run_every=2 if pending else None)(pending)
+
+def report_jobs_panel(polling):
+    queue = get_report_queue()
+    jobs = [queue.status(job_id) for job_id in st.session_state.report_jobs]
+    if polling and not any(job and job["state"] in ("queued", "running") for job in jobs):
+        # Everything finished; a full rerun recreates the panel without the timer
+        st.rerun()
+    for job_id, job in zip(st.session_state.report_jobs, jobs):
+        if job is None:
+            continue
+        label = f"{job['name']} ({job['format'].upper()})"
+        if job["state"] == "done":
+            st.download_button(
+                label=f"{lang['download_results']}: {label}",
+                data=functools.partial(read_job_report, job_id),
+                file_name=f"{lang['season_report']} {job['name']}.{job['format']}",
+                mime=reports.MIME_TYPES[job["format"]],
+                key=f"report_{job_id}",
+            )
+        elif job["state"] == "failed":
+            st.error(f"{lang['report_failed']}: {label}: {job['error']}")
+        else:
+            st.info(f"{lang['report_pending']} {label}")
+
+def discard_bulk_result():
+    result = st.session_state.get("bulk_result")
+    if result and os.path.exists(result["path"]):
+        os.remove(result["path"])
+    st.session_state.bulk_result = None
+
+def read_bulk_result(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def bulk_upload_page():
+    # Pulls in pandas, so only imported once someone opens this page
+    import bulk_upload
+
+    st.subheader(lang["bulk_upload"])
+    st.caption(lang["bulk_upload_help"])
+    uploaded = st.file_uploader(lang["upload_file"], type=["csv", "xlsx"])
+    if uploaded is None:
+        return
+
+    if st.button(lang["process_file"]):
+        discard_bulk_result()
+        progress_bar = st.progress(0.0)
+        progress_state = {"value": 0.0}
+
+        def report(fraction, rows):
+            if fraction is not None:
+                progress_state["value"] = fraction
+            progress_bar.progress(progress_state["value"], text=f"{rows:,} {lang['rows_processed']}")
+
+        # Results go straight to a temp file; only its path is kept in the session
+        output = tempfile.NamedTemporaryFile(
+            "w", suffix=".csv", delete=False, newline="", encoding="utf-8"
+        )
+        ref = get_catalog()
+        sample_archive = get_sample_archive()
 
-    results_text += "\nRecommended Organic Fertilizers:\n"
-    if organic_recommendations:
-        for recommendation in organic_recommendations:
-            results_text += f"- {recommendation}\n"
-    else:
-        results_text += "No organic fertilizer recommendations.\n"
+        skipped = {"rows": 0}
 
-    return results_text
+        def archive_results(results):
+            skipped["rows"] += int((results["status"] != "ok").sum())
+            sample_archive.append(bulk_upload.archive_block(ref, results))
 
-# Main App UI
-st.title("🌱 Smart Soil & Fertilizer Recommendation System")
-
-# Authentication
-menu = st.sidebar.selectbox(lang["menu"], [lang["login"], lang["register"]])
-
-if menu == lang["register"]:
-    st.sidebar.subheader(lang["create_account"])
-    new_user = st.sidebar.text_input(lang["username"])
-    new_pass = st.sidebar.text_input(lang["password"], type="password")
-    if st.sidebar.button(lang["register_button"]):
-        if register_user(new_user, new_pass):
-            st.sidebar.success("Account created successfully!")
-
-elif menu == lang["login"]:
-    st.sidebar.subheader(lang["login"])
-    username = st.sidebar.text_input(lang["username"])
-    password = st.sidebar.text_input(lang["password"], type="password")
-    if st.sidebar.button(lang["login_button"]):
-        if verify_user(username, password):
-            st.success(f"{lang['welcome']} {username}!")
-        else:
-            st.sidebar.error(lang["invalid_credentials"])
+        completed = False
+        try:
+            with output, metrics.span("app.process_file"):
+                rows = bulk_upload.process_file(
+                    ref, uploaded, uploaded.name, output, progress=report, on_results=archive_results
+                )
+            completed = True
+        except ValueError as e:
+            st.error(str(e))
+            return
+        finally:
+            # Whatever went wrong, a partial result file is never kept around
+            if not completed:
+                os.remove(output.name)
+        progress_bar.progress(1.0, text=f"{rows:,} {lang['rows_processed']}")
+        st.session_state.bulk_result = {
+            "path": output.name, "name": uploaded.name, "rows": rows, "skipped": skipped["rows"],
+        }
 
-# Main Application
-if st.session_state.logged_in:
-    try:
-        soils = get_soil_types()
-        if not soils:
-            st.error(lang["no_soil_found"])
-            st.stop()
-
-        soil_choice = st.selectbox(
-            lang["soil_type"],
-            [s["soil_name"] for s in soils]
+    result = st.session_state.get("bulk_result")
+    if result and os.path.exists(result["path"]):
+        if result["skipped"]:
+            st.warning(f"{result['skipped']:,} {lang['rows_skipped']}")
+        st.download_button(
+            label=lang["download_results"],
+            data=functools.partial(read_bulk_result, result["path"]),
+            file_name=f"{os.path.splitext(result['name'])[0]}_{lang['download_file_name']}.csv",
+            mime="text/csv",
         )
-        soil_id = next(s["id"] for s in soils if s["soil_name"] == soil_choice)
 
-        crops_data = get_crops_by_soil(soil_id)
-        if not crops_data:
-            st.error(lang["no_crop_found"])
-            st.stop()
+def dashboard_page():
+    import archive
+
+    st.subheader(lang["dashboard"])
+    get_archive_writer().flush(timeout=2)
+    with metrics.span("app.archive_rollup"):
+        rollup = get_sample_archive().rollup()
+    if not len(rollup):
+        st.info(lang["no_archive_data"])
+        return
+
+    ref = get_catalog()
+    col1, col2 = st.columns(2)
+    nutrient = col1.selectbox(lang["nutrient"], catalog.NUTRIENTS, format_func=lang.__getitem__)
+    regions = sorted(region for region in rollup["region"].unique() if region)
+    region = col2.selectbox(lang["region"], [None] + regions, format_func=lambda r: r or lang["all_regions"])
+    if region is not None:
+        rollup = rollup[rollup["region"] == region]
+
+    st.metric(lang["total_samples"], f"{int(rollup['count'].sum()):,}")
+
+    st.caption(lang["mean_deficit_by_soil"])
+    by_soil = archive.mean_deficit_by_soil_month(rollup, nutrient)
+    by_soil.columns = [ref.soil_names.get(soil_id, soil_id) for soil_id in by_soil.columns]
+    st.line_chart(by_soil)
+
+    st.caption(lang["deficient_share_by_crop"])
+    by_crop = archive.deficient_share_by_crop(rollup, nutrient)
+    by_crop.index = [
+        f"{ref.crop_name(crop_id)} ({ref.soil_names.get(ref.crops[crop_id]['soil_id'], '')})"
+        if crop_id in ref.crops else str(crop_id)
+        for crop_id in by_crop.index
+    ]
+    st.bar_chart(by_crop["share"].sort_values(ascending=False).head(30))
+
+def is_admin():
+    return st.session_state.username in ADMIN_USERS
+
+def metrics_page():
+    st.subheader(lang["metrics"])
+    if not metrics.ENABLED:
+        st.info(lang["metrics_disabled"])
+        return
+
+    snapshot = metrics.registry.snapshot()
+    reruns = snapshot["reruns"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Reruns", reruns["count"])
+    col2.metric("Mean rerun (ms)", f"{reruns['mean_ms']:.1f}")
+    col3.metric("Mean queries per rerun", f"{reruns['mean_queries']:.1f}")
+
+    st.dataframe(
+        [{"span": name, **{key: round(value, 3) for key, value in stats.items()}}
+         for name, stats in snapshot["spans"].items()],
+        hide_index=True,
+    )
+    st.dataframe(
+        [{"metric": name, "value": value} for name, value in sorted(snapshot["gauges"].items())]
+        + [{"metric": name + "".join(f" {k}={v}" for k, v in labels), "value": value}
+           for (name, labels), value in sorted(snapshot["counters"].items())],
+        hide_index=True,
+    )
+    exposition = metrics.registry.render_prometheus()
+    st.download_button("metrics.prom", exposition, file_name="metrics.prom", mime="text/plain")
 
-        crop_names = [c["crop_name"] for c in crops_data]
-        crop_choice = st.selectbox(
-            lang["crop"],
-            crop_names
-        )
+# Main App UI
+rerun_started = metrics.start_rerun()
+try:
+    st.title("🌱 Smart Soil & Fertilizer Recommendation System")
+
+    # Authentication
+    restore_session()
+    menu = st.sidebar.selectbox(lang["menu"], [lang["login"], lang["register"]])
+
+    if menu == lang["register"]:
+        st.sidebar.subheader(lang["create_account"])
+        new_user = st.sidebar.text_input(lang["username"])
+        new_pass = st.sidebar.text_input(lang["password"], type="password")
+        if st.sidebar.button(lang["register_button"]):
+            if register_user(new_user, new_pass):
+                st.sidebar.success("Account created successfully!")
+
+    elif menu == lang["login"]:
+        st.sidebar.subheader(lang["login"])
+        username = st.sidebar.text_input(lang["username"])
+        password = st.sidebar.text_input(lang["password"], type="password")
+        if st.sidebar.button(lang["login_button"]):
+            try:
+                if verify_user(username, password):
+                    st.success(f"{lang['welcome']} {username}!")
+                else:
+                    st.sidebar.error(lang["invalid_credentials"])
+            except auth.AuthBusy:
+                st.sidebar.warning(lang["login_busy"])
+
+    if st.session_state.logged_in:
+        st.sidebar.button(lang["logout"], on_click=logout)
+
+    # Main Application
+    if st.session_state.logged_in:
+        pages = ["single_sample", "bulk_upload", "history", "dashboard"]
+        if is_admin():
+            pages.append("metrics")
+        page = st.sidebar.radio(lang["page"], pages, format_func=lang.__getitem__)
         try:
-            crop_index = crop_names.index(crop_choice)
-        except ValueError:
-            crop_index = -1
-
-        st.subheader(lang["nutrient_levels"])
-        n = st.number_input(lang["nitrogen"], min_value=0)
-        p = st.number_input(lang["phosphorus"], min_value=0)
-        k = st.number_input(lang["potassium"], min_value=0)
-
-        col1, col2, col3 = st.columns(3)
-        if col1.button(lang["analyze_recommend"]):
-            if crop_index != -1:
-                analysis = analyze_soil(crop_index, n, p, k)
-                if analysis:
-                    st.session_state.analysis = analysis
-                    st.session_state.inorganic, st.session_state.organic = recommend_fertilizer(crop_index, n, p, k)
-                    st.rerun()
+            with metrics.span(f"page.{page}"):
+                if page == "bulk_upload":
+                    bulk_upload_page()
+                elif page == "history":
+                    history_page()
+                elif page == "dashboard":
+                    dashboard_page()
+                elif page == "metrics":
+                    metrics_page()
                 else:
-                    st.warning(lang["no_nutrient_data"])
-            else:
-                st.error(lang["crop_determination_failed"])
-
-        if col2.button(lang["reset"]):
-            st.session_state.analysis = None
-            st.session_state.inorganic = []
-            st.session_state.organic = []
-            st.rerun()
-
-        if st.session_state.analysis:
-            st.subheader(lang["analysis_results"])
-            for nutrient, status in st.session_state.analysis.items():
-                st.write(f"{nutrient}: {status}")
-
-            st.subheader(lang["recommended_inorganic"])
-            for fert in st.session_state.inorganic:
-                st.write(fert)
-
-            st.subheader(lang["recommended_organic"])
-            for fert in st.session_state.organic:
-                st.write(fert)
-            
-            if col3.button(lang["download_results"]):
-                results_text = download_results(st.session_state.analysis, st.session_state.inorganic, st.session_state.organic)
-                st.download_button(
-                    label="Download",
-                    data=results_text.encode('utf-8'),
-                    file_name=f"{lang['download_file_name']}.txt",
-                    mime="text/plain",
-                )
-
-    except Exception as e:
-        st.error(f"An error occurred: {str(e)}")
+                    single_sample_page()
+        except Exception as e:
+            report_page_error(page, e)
+finally:
+    metrics.finish_rerun(rerun_started)
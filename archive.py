@@ -0,0 +1,459 @@
+# archive.py
+"""Append-only columnar archive of every submitted soil sample.
+
+    sample_archive/
+      2026-10/                        one directory per month
+        01760000000000000000-4242/    one segment per append
+          day.npy soil_id.npy ... nitrogen_deficit.npy
+          regions.json                region names for this segment's codes
+          rollup.npz                  per-group aggregates of this segment
+
+Columns are compact typed NumPy arrays, read back memory-mapped. Segments
+are written to a temporary directory and renamed into place, so readers
+never see a partial segment and several processes can append at once.
+
+Each segment stores its own rollup: sample counts, deficit sums and
+deficient counts per (month, soil, crop, region). Dashboards add up
+rollups instead of rescanning samples, so appending a batch only costs
+that batch. A background thread merges segments of a similar size,
+COMPACTION_FANOUT at a time, so a month holds a few segments per size
+tier and no merge rewrites much more data than it adds.
+
+    python archive.py compact             # merge every month's segments
+    python archive.py summary
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from catalog import NUTRIENTS
+from history import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = os.environ.get("SOIL_ARCHIVE_DIR", "sample_archive")
+
+COLUMNS = {
+    "day": np.int32,  # days since 1970-01-01
+    "soil_id": np.int32,
+    "crop_id": np.int32,
+    "region": np.uint16,  # index into the segment's regions.json
+    "nitrogen": np.float32,
+    "phosphorus": np.float32,
+    "potassium": np.float32,
+    "nitrogen_deficit": np.float32,
+    "phosphorus_deficit": np.float32,
+    "potassium_deficit": np.float32,
+}
+ROLLUP_KEYS = ("month", "soil_id", "crop_id", "region")
+# This many segments in one size tier (rows within a factor of it) are merged
+COMPACTION_FANOUT = 16
+COMPACTED_SUFFIX = "-c"
+# A compaction lock older than this is assumed to belong to a dead process
+STALE_LOCK_SECONDS = 600
+
+
+def today():
+    return int(np.datetime64("today", "D").astype(np.int64))
+
+
+def month_of(days):
+    """Months since 1970-01 for an array of day numbers"""
+    return np.asarray(days, dtype=np.int64).astype("datetime64[D]").astype("datetime64[M]").astype(np.int32)
+
+
+def month_label(month):
+    return str(np.datetime64(int(month), "M"))
+
+
+def compute_rollup(columns):
+    """Aggregate one segment's columns by ROLLUP_KEYS"""
+    keys = np.column_stack([
+        month_of(columns["day"]),
+        columns["soil_id"],
+        columns["crop_id"],
+        columns["region"].astype(np.int32),
+    ])
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    size = len(groups)
+    rollup = {name: groups[:, i] for i, name in enumerate(ROLLUP_KEYS)}
+    rollup["count"] = np.bincount(inverse, minlength=size).astype(np.int64)
+    deficient_any = np.zeros(len(inverse), dtype=bool)
+    for nutrient in NUTRIENTS:
+        deficit = np.asarray(columns[f"{nutrient}_deficit"], dtype=np.float64)
+        deficient = deficit > 0
+        deficient_any |= deficient
+        rollup[f"{nutrient}_deficit_sum"] = np.bincount(inverse, weights=deficit, minlength=size)
+        rollup[f"{nutrient}_deficient"] = np.bincount(inverse, weights=deficient, minlength=size).astype(np.int64)
+    rollup["any_deficient"] = np.bincount(inverse, weights=deficient_any, minlength=size).astype(np.int64)
+    return rollup
+
+
+def merge_rollups(rollups):
+    """Sum rollups whose keys (including region codes) share one vocabulary"""
+    keys = np.column_stack([np.concatenate([rollup[name] for rollup in rollups]) for name in ROLLUP_KEYS])
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    merged = {name: groups[:, i] for i, name in enumerate(ROLLUP_KEYS)}
+    for name in rollups[0]:
+        if name not in ROLLUP_KEYS:
+            values = np.concatenate([rollup[name] for rollup in rollups])
+            merged[name] = np.bincount(inverse, weights=values, minlength=len(groups)).astype(values.dtype)
+    return merged
+
+
+def make_block(soil_id, crop_id, levels, deficits, region=None, day=None):
+    """Column dict ready for SampleArchive.append.
+
+    levels and deficits are (samples, 3) N/P/K arrays; region is an array of
+    names (or one name) and day an array of day numbers (default today).
+    """
+    soil_id = np.asarray(soil_id, dtype=np.int32).reshape(-1)
+    count = len(soil_id)
+    levels = np.asarray(levels, dtype=np.float32).reshape(count, len(NUTRIENTS))
+    deficits = np.asarray(deficits, dtype=np.float32).reshape(count, len(NUTRIENTS))
+    if region is None or isinstance(region, str):
+        region = np.full(count, region or "", dtype=object)
+    if day is None:
+        day = np.full(count, today(), dtype=np.int32)
+    block = {
+        "day": np.asarray(day, dtype=np.int32).reshape(-1),
+        "soil_id": soil_id,
+        "crop_id": np.asarray(crop_id, dtype=np.int32).reshape(-1),
+        "region": np.asarray(region, dtype=object).reshape(-1),
+    }
+    for j, nutrient in enumerate(NUTRIENTS):
+        block[nutrient] = levels[:, j]
+        block[f"{nutrient}_deficit"] = deficits[:, j]
+    return block
+
+
+def concat_blocks(blocks):
+    return {name: np.concatenate([block[name] for block in blocks]) for name in COLUMNS}
+
+
+class SampleArchive:
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rollups = {}
+        self._merged = None
+        self._compact_months = set()
+        self._compactor = None
+
+    # Writing
+    def append(self, block):
+        """Write a block of samples as one new segment per month it spans"""
+        if not len(block["day"]):
+            return []
+        months = month_of(block["day"])
+        paths = []
+        for month in np.unique(months):
+            rows = months == month
+            part = {name: np.asarray(block[name])[rows] for name in COLUMNS}
+            paths.append(self._write_segment(month_label(month), part))
+            self._request_compaction(month_label(month))
+        return paths
+
+    def _write_segment(self, month, block):
+        regions, codes = np.unique(block["region"].astype(str), return_inverse=True)
+        if len(regions) > np.iinfo(np.uint16).max:
+            raise ValueError("Too many distinct regions in one segment")
+        columns = {name: np.asarray(block[name]).astype(dtype) for name, dtype in COLUMNS.items() if name != "region"}
+        columns["region"] = codes.reshape(-1).astype(np.uint16)
+        return self._write_columns(month, columns, regions.tolist(), compute_rollup(columns))
+
+    def _write_columns(self, month, columns, regions, rollup, replaces=()):
+        name = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident() % 100000}"
+        if replaces:
+            name += COMPACTED_SUFFIX
+        tmp = os.path.join(self.root, f".tmp-{name}")
+        os.makedirs(tmp)
+        try:
+            for column, values in columns.items():
+                np.save(os.path.join(tmp, f"{column}.npy"), values)
+            with open(os.path.join(tmp, "regions.json"), "w") as f:
+                json.dump(regions, f)
+            np.savez(os.path.join(tmp, "rollup.npz"), **rollup)
+            if replaces:
+                with open(os.path.join(tmp, "replaces.json"), "w") as f:
+                    json.dump(sorted(replaces), f)
+            month_dir = os.path.join(self.root, month)
+            os.makedirs(month_dir, exist_ok=True)
+            path = os.path.join(month_dir, name)
+            os.rename(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return path
+
+    # Reading
+    def months(self):
+        return sorted(
+            entry for entry in os.listdir(self.root)
+            if not entry.startswith(".") and os.path.isdir(os.path.join(self.root, entry))
+        )
+
+    def segments(self, start=None, end=None):
+        """Segment paths, optionally limited to months start..end ("YYYY-MM")"""
+        paths = []
+        for month in self.months():
+            if (start and month < start) or (end and month > end):
+                continue
+            month_dir = os.path.join(self.root, month)
+            entries = [entry for entry in sorted(os.listdir(month_dir)) if not entry.startswith(".")]
+            # A compacted segment appears before its sources are removed; hide them
+            replaced = set()
+            for entry in entries:
+                if entry.endswith(COMPACTED_SUFFIX):
+                    try:
+                        with open(os.path.join(month_dir, entry, "replaces.json")) as f:
+                            replaced.update(json.load(f))
+                    except FileNotFoundError:
+                        pass
+            paths.extend(os.path.join(month_dir, entry) for entry in entries if entry not in replaced)
+        return paths
+
+    @staticmethod
+    def read_segment(path, columns=None):
+        """Memory-mapped columns of one segment; region comes back as names"""
+        columns = columns or list(COLUMNS)
+        data = {}
+        for column in columns:
+            values = np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+            if column == "region":
+                with open(os.path.join(path, "regions.json")) as f:
+                    values = np.asarray(json.load(f), dtype=object)[values]
+            data[column] = values
+        return data
+
+    def scan(self, columns=None, start=None, end=None):
+        """Concatenated columns for every sample in months start..end"""
+        columns = columns or list(COLUMNS)
+        parts = []
+        for path in self.segments(start, end):
+            try:
+                parts.append(self.read_segment(path, columns))
+            except FileNotFoundError:
+                # Compacted away since listing; its rows are in the merged segment
+                continue
+        if not parts:
+            return {column: np.empty(0, dtype=object if column == "region" else COLUMNS[column])
+                    for column in columns}
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    def _load_rollup(self, path):
+        with np.load(os.path.join(path, "rollup.npz")) as stored:
+            rollup = {name: stored[name] for name in stored.files}
+        with open(os.path.join(path, "regions.json")) as f:
+            regions = np.asarray(json.load(f), dtype=object)
+        rollup["region"] = regions[rollup["region"]]
+        return rollup
+
+    def rollup(self):
+        """All segment rollups merged into one pandas DataFrame.
+
+        Segment rollups are cached in memory, so a call only reads segments
+        added since the last one.
+        """
+        import pandas as pd
+
+        for _ in range(3):
+            paths = self.segments()
+            try:
+                with self._lock:
+                    for path in paths:
+                        if path not in self._rollups:
+                            self._rollups[path] = self._load_rollup(path)
+                    current = set(paths)
+                    for path in list(self._rollups):
+                        if path not in current:
+                            del self._rollups[path]
+                    key = tuple(paths)
+                    if self._merged is not None and self._merged[0] == key:
+                        return self._merged[1]
+                    parts = [self._rollups[path] for path in paths]
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise RuntimeError("Archive kept changing while reading rollups")
+
+        if not parts:
+            merged = pd.DataFrame(columns=list(ROLLUP_KEYS) + ["count"])
+        else:
+            frame = pd.DataFrame({name: np.concatenate([part[name] for part in parts]) for name in parts[0]})
+            merged = frame.groupby(list(ROLLUP_KEYS), as_index=False, sort=False).sum()
+        with self._lock:
+            self._merged = (key, merged)
+        return merged
+
+    # Maintenance
+    def _request_compaction(self, month):
+        # Merges run on one background thread so appends never wait for them
+        with self._lock:
+            self._compact_months.add(month)
+            if self._compactor is not None:
+                return
+            self._compactor = threading.Thread(target=self._compact_pending, name="archive-compactor", daemon=True)
+            self._compactor.start()
+
+    def _compact_pending(self):
+        while True:
+            with self._lock:
+                if not self._compact_months:
+                    self._compactor = None
+                    return
+                month = self._compact_months.pop()
+            try:
+                self.compact_tiers(month)
+            except Exception:
+                logger.exception("Compacting archive month %s failed", month)
+
+    def wait_for_compaction(self, timeout=None):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join(timeout)
+
+    @contextmanager
+    def _compaction_lock(self, month):
+        """Yields False if another process is compacting month"""
+        lock = os.path.join(self.root, month, ".compact.lock")
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.remove(lock)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            os.remove(lock)
+
+    @staticmethod
+    def _tier(path):
+        rows = np.load(os.path.join(path, "day.npy"), mmap_mode="r").shape[0]
+        tier = 0
+        while rows >= COMPACTION_FANOUT ** (tier + 1):
+            tier += 1
+        return tier
+
+    def compact_tiers(self, month):
+        """Merge COMPACTION_FANOUT same-tier segments at a time until no tier is full"""
+        with self._compaction_lock(month) as locked:
+            if not locked:
+                return False
+            while True:
+                tiers = {}
+                for path in self.segments(month, month):
+                    tiers.setdefault(self._tier(path), []).append(path)
+                full = [paths for tier, paths in sorted(tiers.items()) if len(paths) >= COMPACTION_FANOUT]
+                if not full:
+                    return True
+                self._merge(month, full[0][:COMPACTION_FANOUT])
+
+    def compact(self, month):
+        """Merge all of a month's segments into one; returns False if another process holds the lock"""
+        with self._compaction_lock(month) as locked:
+            if not locked:
+                return False
+            paths = self.segments(month, month)
+            if len(paths) >= 2:
+                self._merge(month, paths)
+            return True
+
+    def _merge(self, month, paths):
+        # Region codes are remapped onto the union of the segments' names;
+        # the names themselves are never expanded per row
+        vocabularies = []
+        for path in paths:
+            with open(os.path.join(path, "regions.json")) as f:
+                vocabularies.append(json.load(f))
+        regions = sorted(set().union(*vocabularies))
+        if len(regions) > np.iinfo(np.uint16).max:
+            raise ValueError("Too many distinct regions in one segment")
+        remaps = [np.searchsorted(regions, vocabulary).astype(np.uint16) if vocabulary else np.zeros(0, np.uint16)
+                  for vocabulary in vocabularies]
+
+        columns, rollups = {name: [] for name in COLUMNS}, []
+        for path, remap in zip(paths, remaps):
+            for name in COLUMNS:
+                values = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                columns[name].append(remap[values] if name == "region" else values)
+            with np.load(os.path.join(path, "rollup.npz")) as stored:
+                rollup = {name: stored[name] for name in stored.files}
+            rollup["region"] = remap[rollup["region"]].astype(np.int32)
+            rollups.append(rollup)
+        self._write_columns(
+            month,
+            {name: np.concatenate(parts) for name, parts in columns.items()},
+            regions,
+            merge_rollups(rollups),
+            replaces=[os.path.basename(path) for path in paths],
+        )
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class ArchiveWriter(WriteBehindQueue):
+    """Buffers blocks and writes each flushed batch as one segment"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(lambda blocks: archive.append(concat_blocks(blocks)), name="archive-writer", **kwargs)
+
+    def record(self, soil_id, crop_id, levels, deficits, region=None):
+        self.put(make_block([soil_id], [crop_id], [levels], [deficits], region))
+
+
+# Aggregate queries over SampleArchive.rollup()
+def mean_deficit_by_soil_month(rollup, nutrient):
+    """Mean deficit of nutrient, months as rows and soil ids as columns"""
+    grouped = rollup.groupby(["month", "soil_id"])[[f"{nutrient}_deficit_sum", "count"]].sum()
+    mean = (grouped[f"{nutrient}_deficit_sum"] / grouped["count"]).unstack("soil_id")
+    mean.index = [month_label(month) for month in mean.index]
+    return mean
+
+
+def deficient_share_by_crop(rollup, nutrient=None):
+    """Samples and share deficient per crop; nutrient None means deficient in any"""
+    column = "any_deficient" if nutrient is None else f"{nutrient}_deficient"
+    grouped = rollup.groupby("crop_id")[[column, "count"]].sum()
+    grouped["share"] = grouped[column] / grouped["count"]
+    return grouped.rename(columns={"count": "samples"})[["samples", "share"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the soil sample archive")
+    parser.add_argument("command", choices=["compact", "summary"])
+    parser.add_argument("--dir", default=DEFAULT_ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    archive = SampleArchive(args.dir)
+    if args.command == "compact":
+        for month in archive.months():
+            before = len(archive.segments(month, month))
+            if archive.compact(month):
+                print(f"{month}: {before} segments -> {len(archive.segments(month, month))}")
+            else:
+                print(f"{month}: skipped, another compaction is running")
+    else:
+        rollup = archive.rollup()
+        print(f"{int(rollup['count'].sum()) if len(rollup) else 0:,} samples in "
+              f"{len(archive.segments())} segments over {len(archive.months())} months")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# auth.py
+"""Password hashing, login verification and signed session tokens.
+
+Stored hashes name their scheme, so the KDF can change without a
+migration:
+
+    scrypt$16384$8$1$<salt>$<hash>
+    pbkdf2_sha256$600000$<salt>$<hash>
+    <64 hex chars>                      legacy unsalted SHA-256, verify only
+
+A successful login against anything other than the current scheme and
+parameters rewrites the row with a fresh hash. KDF work runs on a small
+bounded executor, so a burst of logins queues up instead of pinning every
+script thread, and callers past the queue limit get AuthBusy. After a
+login, the session holds an HMAC-signed token that is checked against an
+in-memory cache, so reruns never touch SQLite or the KDF.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+DEFAULT_HASHER = os.environ.get("SOIL_PASSWORD_HASHER", "scrypt")
+SESSION_TTL = 12 * 60 * 60
+# What a corrupt stored hash raises while being parsed; verification just fails
+MALFORMED = (ValueError, TypeError, OverflowError)
+
+
+class AuthBusy(Exception):
+    """Too many logins are already waiting for the KDF"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# Hashers
+class ScryptHasher:
+    scheme = "scrypt"
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n, self.r, self.p = n, r, p
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{self.scheme}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        try:
+            _, n, r, p, salt, digest = encoded.split("$")
+            derived = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(derived, _b64decode(digest))
+        except MALFORMED:
+            return False
+
+    def is_current(self, encoded):
+        return encoded.startswith(f"{self.scheme}${self.n}${self.r}${self.p}$")
+
+
+class Pbkdf2Hasher:
+    scheme = "pbkdf2_sha256"
+
+    def __init__(self, iterations=600_000):
+        self.iterations = iterations
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, self.iterations)
+        return f"{self.scheme}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        try:
+            _, iterations, salt, digest = encoded.split("$")
+            derived = hashlib.pbkdf2_hmac("sha256", password.encode(), _b64decode(salt), int(iterations))
+            return hmac.compare_digest(derived, _b64decode(digest))
+        except MALFORMED:
+            return False
+
+    def is_current(self, encoded):
+        return encoded.startswith(f"{self.scheme}${self.iterations}$")
+
+
+class LegacySha256Hasher:
+    """The original unsalted hex digest; only ever verified, never written"""
+    scheme = "sha256"
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+
+    def is_current(self, encoded):
+        return False
+
+
+HASHERS = {"scrypt": ScryptHasher, "pbkdf2": Pbkdf2Hasher}
+LEGACY = LegacySha256Hasher()
+
+
+def get_hasher(name=DEFAULT_HASHER):
+    try:
+        return HASHERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown password hasher {name!r}; choose from {', '.join(HASHERS)}")
+
+
+def hasher_for(encoded, current):
+    """The hasher that can verify encoded, or None if the format is unknown"""
+    scheme = encoded.split("$", 1)[0]
+    for hasher in (current, ScryptHasher(), Pbkdf2Hasher()):
+        if hasher.scheme == scheme:
+            return hasher
+    if len(encoded) == 64 and all(c in "0123456789abcdef" for c in encoded):
+        return LEGACY
+    return None
+
+
+# Session tokens
+class SessionTokens:
+    """HMAC-signed "user_id.username.expires.signature" tokens, cached in memory.
+
+    With SOIL_SESSION_SECRET set, tokens outlive a process restart and are
+    re-validated by signature alone; otherwise each process signs with a
+    random key.
+    """
+
+    def __init__(self, secret=None, ttl=SESSION_TTL, max_cached=100_000):
+        secret = secret or os.environ.get("SOIL_SESSION_SECRET")
+        self._key = secret.encode() if secret else secrets.token_bytes(32)
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache = {}
+        self._revoked = {}  # token -> expires; dropped once the token would have expired anyway
+        self._next_prune = 0
+        self._lock = threading.Lock()
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id, username):
+        expires = int(time.time()) + self.ttl
+        payload = f"{user_id}.{_b64encode(username.encode())}.{expires}"
+        token = f"{payload}.{self._sign(payload)}"
+        with self._lock:
+            if len(self._cache) >= self.max_cached:
+                self._cache.clear()
+            self._cache[token] = (user_id, username, expires)
+        return token
+
+    def validate(self, token):
+        """(user_id, username) for a live token, else None"""
+        if not token:
+            return None
+        cached = self._cache.get(token)
+        if cached is None:
+            cached = self._verify(token)
+            if cached is None:
+                return None
+            with self._lock:
+                self._cache[token] = cached
+        if cached[2] < time.time():
+            # Expired tokens fail on their own; no need to remember them
+            with self._lock:
+                self._cache.pop(token, None)
+            return None
+        return cached[0], cached[1]
+
+    def _verify(self, token):
+        try:
+            payload, signature = token.rsplit(".", 1)
+            user_id, username, expires = payload.split(".")
+            if token in self._revoked or not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            return int(user_id), _b64decode(username).decode(), int(expires)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def revoke(self, token):
+        entry = self._cache.get(token) or self._verify(token)
+        now = time.time()
+        with self._lock:
+            self._cache.pop(token, None)
+            if entry is not None and entry[2] >= now:
+                self._revoked[token] = entry[2]
+            if now >= self._next_prune:
+                self._revoked = {t: expires for t, expires in self._revoked.items() if expires >= now}
+                self._next_prune = now + 60
+
+
+# Accounts
+class AuthService:
+    """Registration and login with KDF work on a bounded worker pool"""
+
+    def __init__(self, pool, hasher=None, max_workers=2, max_pending=64, wait_timeout=10.0, tokens=None):
+        self.pool = pool
+        self.hasher = hasher or get_hasher()
+        self.wait_timeout = wait_timeout
+        self.tokens = tokens or SessionTokens()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Verified for unknown usernames so they take as long as real ones
+        self._dummy_hash = self.hasher.encode(secrets.token_hex(16))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            metrics.inc("auth_busy_total")
+            raise AuthBusy("Too many logins in progress; please try again")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    @metrics.timed("auth.register_user")
+    def register_user(self, username, password):
+        """Create a user; returns False if the username is taken"""
+        encoded = self._run(self.hasher.encode, password)
+        try:
+            self.pool.execute_write(
+                "INSERT INTO users (username, password) VALUES (?, ?)",
+                (username, encoded)
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    @metrics.timed("auth.authenticate")
+    def authenticate(self, username, password):
+        """Return (user_id, username) for valid credentials, else None"""
+        with self.pool.read() as conn:
+            user = conn.execute(
+                "SELECT id, username, password FROM users WHERE username = ?",
+                (username,)
+            ).fetchone()
+        if user is None:
+            self._run(self.hasher.verify, password, self._dummy_hash)
+            return None
+
+        user_id, name, stored = user
+        hasher = hasher_for(stored, self.hasher)
+        if hasher is None or not self._run(hasher.verify, password, stored):
+            return None
+        if not self.hasher.is_current(stored):
+            self._rehash(user_id, stored, password)
+        return user_id, name
+
+    def _rehash(self, user_id, stored, password):
+        encoded = self._run(self.hasher.encode, password)
+        # Guarded on the old value so a concurrent password change wins
+        self.pool.execute_write(
+            "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+            (encoded, user_id, stored)
+        )
+        metrics.inc("auth_rehash_total")
+
+    def login(self, username, password):
+        """Session token for valid credentials, else None"""
+        user = self.authenticate(username, password)
+        if user is None:
+            return None
+        return self.tokens.issue(*user)
+
+    def current_user(self, token):
+        return self.tokens.validate(token)
+
+    def logout(self, token):
+        self.tokens.revoke(token)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
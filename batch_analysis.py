@@ -0,0 +1,125 @@
+# batch_analysis.py
+"""Vectorized soil analysis and fertilizer amounts for many samples at once.
+
+Results match analyze_soil/recommend_fertilizer in app.py: the same float64
+operations are applied, just broadcast over (samples, products, nutrients).
+The cheapest-blend columns come from blend_solver's batch solve.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import blend_solver
+from catalog import INORGANIC_FERTILIZERS, NUTRIENTS, ORGANIC_FERTILIZERS
+
+PRODUCTS = INORGANIC_FERTILIZERS + ORGANIC_FERTILIZERS
+PRODUCT_NAMES = [product["name"] for product in PRODUCTS]
+ORGANIC_MASK = np.array([product in ORGANIC_FERTILIZERS for product in PRODUCTS])
+
+# (products, nutrients) percent content matrix
+NUTRIENT_CONTENT = np.array(
+    [[product[nutrient] for nutrient in NUTRIENTS] for product in PRODUCTS],
+    dtype=np.float64,
+)
+
+
+@lru_cache(maxsize=4)
+def standards_table(catalog):
+    """Dense (max_crop_id + 1, 3) array of standards, NaN where a crop has none"""
+    size = max(catalog.standards, default=-1) + 1
+    table = np.full((size, len(NUTRIENTS)), np.nan)
+    for crop_id, std in catalog.standards.items():
+        table[crop_id] = [std[nutrient] for nutrient in NUTRIENTS]
+    return table
+
+
+def lookup_standards(catalog, crop_ids):
+    """Return (standards, known) for an array of crop ids"""
+    table = standards_table(catalog)
+    crop_ids = np.asarray(crop_ids, dtype=np.int64)
+    in_range = (crop_ids >= 0) & (crop_ids < len(table))
+    standards = np.full((len(crop_ids), len(NUTRIENTS)), np.nan)
+    standards[in_range] = table[crop_ids[in_range]]
+    known = ~np.isnan(standards).any(axis=1)
+    return standards, known
+
+
+def nutrient_balance(standards, levels):
+    """Signed level - standard per nutrient; positive is excess"""
+    return levels - standards
+
+
+def nutrient_deficiency(standards, levels):
+    return np.maximum(0, standards - levels)
+
+
+def product_amounts(deficiency, content=NUTRIENT_CONTENT):
+    """kg of each product needed per deficient nutrient.
+
+    Shape (samples, products, nutrients); NaN where the product does not
+    supply the nutrient or there is no deficiency.
+    """
+    deficiency = deficiency[:, None, :]
+    content = content[None, :, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amounts = (deficiency / content) * 100
+    return np.where((content > 0) & (deficiency > 0), amounts, np.nan)
+
+
+def amount_column(product_name, nutrient):
+    return f"{product_name.lower()}_{nutrient}_kg"
+
+
+def blend_column(product_name):
+    return f"blend_{product_name.lower()}_kg"
+
+
+def analyze_batch(catalog, crop_ids, nitrogen, phosphorus, potassium):
+    """Analyze and recommend for every sample; returns one row per sample.
+
+    Balance columns are NaN and has_standard is False for crops without a
+    standard, mirroring the scalar functions returning None / empty lists.
+    """
+    levels = np.column_stack([
+        np.asarray(nitrogen, dtype=np.float64),
+        np.asarray(phosphorus, dtype=np.float64),
+        np.asarray(potassium, dtype=np.float64),
+    ])
+    standards, known = lookup_standards(catalog, crop_ids)
+    balance = nutrient_balance(standards, levels)
+    deficiency = nutrient_deficiency(standards, levels)
+    amounts = product_amounts(deficiency)
+    solver = blend_solver.default_solver()
+    blend, blend_cost = solver.solve_batch(deficiency)
+
+    columns = {
+        "crop_id": np.asarray(crop_ids),
+        "nitrogen": levels[:, 0],
+        "phosphorus": levels[:, 1],
+        "potassium": levels[:, 2],
+        "has_standard": known,
+    }
+    for j, nutrient in enumerate(NUTRIENTS):
+        columns[f"{nutrient}_standard"] = standards[:, j]
+    for j, nutrient in enumerate(NUTRIENTS):
+        columns[f"{nutrient}_balance"] = balance[:, j]
+    for i, name in enumerate(PRODUCT_NAMES):
+        for j, nutrient in enumerate(NUTRIENTS):
+            if NUTRIENT_CONTENT[i, j] > 0:
+                columns[amount_column(name, nutrient)] = amounts[:, i, j]
+    for i, name in enumerate(solver.products):
+        columns[blend_column(name)] = blend[:, i]
+    columns["blend_cost"] = blend_cost
+    return pd.DataFrame(columns)
+
+
+def analyze_frame(catalog, samples):
+    """analyze_batch over a DataFrame with crop_id/nitrogen/phosphorus/potassium columns"""
+    return analyze_batch(
+        catalog,
+        samples["crop_id"].to_numpy(),
+        samples["nitrogen"].to_numpy(),
+        samples["phosphorus"].to_numpy(),
+        samples["potassium"].to_numpy(),
+    )
@@ -0,0 +1,98 @@
+# batch_cli.py
+"""Offline recommendation runs over a file of samples.
+
+    python batch_cli.py samples.csv recommendations.csv --workers 8 --chunk-size 100000
+
+Input chunks are analyzed on a process pool; each worker loads the
+catalog once. Results are written in input order, and at most a few
+chunks per worker are in flight so memory stays bounded.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bulk_upload
+import catalog
+import db_setup
+
+_worker_catalog = None
+
+
+def init_worker(db_path):
+    global _worker_catalog
+    conn = db_setup.connect(db_path)
+    try:
+        _worker_catalog = catalog.load_catalog(conn)
+    finally:
+        conn.close()
+
+
+def analyze_chunk(chunk, header):
+    """Analyze one chunk and render it to CSV text in the worker"""
+    results = bulk_upload.analyze_chunk(_worker_catalog, chunk)
+    return results.to_csv(header=header, index=False, float_format="%.2f"), len(results)
+
+
+def run(input_path, output_path, db_path=db_setup.DB_PATH, workers=None,
+        chunksize=bulk_upload.DEFAULT_CHUNK_SIZE, log=None):
+    """Analyze every sample in input_path and write them to output_path.
+
+    Returns the number of rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    db_setup.ensure_db(db_path)
+    max_pending = workers * 2
+    rows = 0
+
+    with open(input_path, "rb") as source, \
+            open(output_path, "w", newline="", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(db_path,)) as pool:
+        pending = deque()
+
+        def write_next():
+            nonlocal rows
+            text, count = pending.popleft().result()
+            out.write(text)
+            rows += count
+            if log:
+                log(rows)
+
+        chunks = bulk_upload.iter_sample_chunks(source, input_path, chunksize)
+        for index, chunk in enumerate(chunks):
+            pending.append(pool.submit(analyze_chunk, chunk, index == 0))
+            if len(pending) >= max_pending:
+                write_next()
+        while pending:
+            write_next()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate fertilizer recommendations for a file of samples")
+    parser.add_argument("input", help="CSV or Excel file with crop_id (or soil_name and crop_name) and N/P/K columns")
+    parser.add_argument("output", help="CSV file to write recommendations to")
+    parser.add_argument("--db", default=db_setup.DB_PATH, help="SQLite database with the reference data")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=bulk_upload.DEFAULT_CHUNK_SIZE,
+                        help="rows per chunk handed to a worker")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        rows = run(
+            args.input, args.output, db_path=args.db, workers=args.workers, chunksize=args.chunk_size,
+            log=lambda done: print(f"\r{done:,} rows", end="", file=sys.stderr, flush=True),
+        )
+    except (OSError, ValueError) as e:
+        print(f"\nError: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+    print(f"\nWrote {rows:,} rows to {args.output} in {elapsed:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
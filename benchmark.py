@@ -0,0 +1,334 @@
+# benchmark.py
+"""Reproducible benchmarks for the DB helpers, recommendation math and full app reruns.
+
+    python benchmark.py                      # small scale, compare to baseline
+    python benchmark.py --scale large        # millions of users and samples
+    python benchmark.py --save-baseline      # record the current numbers
+
+Synthetic soils, crops, standards and users are generated into a temporary
+database with a fixed seed. Every case is timed repeatedly and reported
+as percentiles. If a baseline file exists, any case whose p50 is more than
+--tolerance times (and --min-delta-us above) its baseline fails the run
+with exit status 1.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import auth
+import batch_analysis
+import blend_solver
+import catalog
+import db_pool
+import db_setup
+import engine
+import history
+
+SCALES = {
+    "small": {"soils": 50, "crops_per_soil": 40, "users": 10_000, "samples": 100_000},
+    "medium": {"soils": 200, "crops_per_soil": 100, "users": 200_000, "samples": 1_000_000},
+    "large": {"soils": 500, "crops_per_soil": 100, "users": 1_000_000, "samples": 5_000_000},
+}
+DEFAULT_BASELINE = "benchmark_baseline.json"
+BENCH_PASSWORD = "bench-password"
+LANG = {"excess_by": "Excess by", "deficient_by": "Deficient by", "balanced": "Balanced"}
+
+
+def build_database(db_path, soils, crops_per_soil, users, seed=0):
+    """Migrate a fresh database and fill it with synthetic reference data and users"""
+    rng = random.Random(seed)
+    db_setup.ensure_db(db_path)
+    conn = db_setup.connect(db_path)
+    try:
+        conn.execute("DELETE FROM crop_nutrient_standards")
+        conn.execute("DELETE FROM crops")
+        conn.execute("DELETE FROM soiltypes")
+        conn.executemany(
+            "INSERT INTO soiltypes (id, soil_name) VALUES (?, ?)",
+            [(i, f"Soil {i:05d}") for i in range(1, soils + 1)]
+        )
+        crops = [
+            (soil_id * crops_per_soil + j, f"Crop {j:05d}", soil_id)
+            for soil_id in range(1, soils + 1)
+            for j in range(crops_per_soil)
+        ]
+        conn.executemany("INSERT INTO crops (id, crop_name, soil_id) VALUES (?, ?, ?)", crops)
+        conn.executemany(
+            "INSERT INTO crop_nutrient_standards (crop_id, soil_id, nitrogen, phosphorus, potassium) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(crop_id, soil_id, rng.randint(30, 120), rng.randint(20, 90), rng.randint(20, 100))
+             for crop_id, _, soil_id in crops]
+        )
+        password = auth.get_hasher().encode(BENCH_PASSWORD)
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+            ((f"user{i:08d}", password) for i in range(users))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return [crop_id for crop_id, _, _ in crops]
+
+
+def make_samples(crop_ids, count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.choice(np.asarray(crop_ids), count),
+        rng.integers(0, 150, count),
+        rng.integers(0, 120, count),
+        rng.integers(0, 130, count),
+    )
+
+
+def time_calls(fn, repeat, warmup=3):
+    """Per-call wall times in microseconds"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        fn()
+        times.append((time.perf_counter_ns() - start) / 1000)
+    return times
+
+
+def summarize(times):
+    ordered = sorted(times)
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_us": statistics.fmean(ordered),
+        "p50_us": pct(50),
+        "p90_us": pct(90),
+        "p99_us": pct(99),
+        "max_us": ordered[-1],
+    }
+
+
+def cycle(values):
+    """Callable returning successive values, wrapping around"""
+    state = {"i": -1}
+
+    def next_value():
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+
+    return next_value
+
+
+def bench_db(db_path, params, repeat, results):
+    pool = db_pool.ConnectionPool(db_path)
+    try:
+        def migrate_noop():
+            conn = db_setup.connect(db_path)
+            try:
+                db_setup.migrate(conn)
+            finally:
+                conn.close()
+
+        def checkout():
+            with pool.read() as conn:
+                conn.execute("SELECT 1").fetchone()
+
+        results["setup_db (already migrated)"] = summarize(time_calls(migrate_noop, repeat))
+        results["get_db_connection (pool checkout)"] = summarize(time_calls(checkout, repeat))
+
+        def cold_catalog():
+            with pool.read() as conn:
+                catalog.load_catalog(conn)
+
+        results["catalog load (cold)"] = summarize(time_calls(cold_catalog, max(5, repeat // 20), warmup=1))
+
+        def snapshot_catalog():
+            with pool.read() as conn:
+                catalog.load_from_snapshot(conn, db_path)
+
+        results["catalog load (snapshot)"] = summarize(time_calls(snapshot_catalog, max(5, repeat // 20), warmup=1))
+
+        cache = catalog.CatalogCache(pool)
+        ref = cache.get()
+        soil_ids = cycle(ref.soil_ids)
+        results["get_soil_types"] = summarize(time_calls(lambda: cache.get().soils, repeat))
+        results["get_crops_by_soil"] = summarize(
+            time_calls(lambda: cache.get().crops_by_soil.get(soil_ids(), []), repeat)
+        )
+
+        rng = random.Random(1)
+        usernames = cycle([f"user{rng.randrange(params['users']):08d}" for _ in range(1000)])
+        service = auth.AuthService(pool)
+        try:
+            # Each call runs the KDF on purpose, so fewer repeats
+            results["verify_user"] = summarize(
+                time_calls(lambda: service.authenticate(usernames(), BENCH_PASSWORD), max(5, repeat // 20))
+            )
+            token = service.login(usernames(), BENCH_PASSWORD)
+            results["verify_user (session token)"] = summarize(
+                time_calls(lambda: service.current_user(token), repeat)
+            )
+        finally:
+            service.close()
+        return ref
+    finally:
+        pool.close()
+
+
+def bench_math(ref, crop_ids, params, repeat, results):
+    ids, n, p, k = make_samples(crop_ids, params["samples"])
+    scalar = cycle([(int(ids[i]), int(n[i]), int(p[i]), int(k[i])) for i in range(min(len(ids), 10_000))])
+
+    results["analyze_soil"] = summarize(
+        time_calls(lambda: engine.analyze_soil(ref, *scalar(), LANG), repeat)
+    )
+    results["recommend_fertilizer"] = summarize(
+        time_calls(lambda: engine.recommend_fertilizer(ref, *scalar()), repeat)
+    )
+    # Farmers resubmit a small set of common triples; model that as 100 hot keys
+    hot = cycle([scalar() for _ in range(100)])
+    cache = engine.RecommendationCache()
+    results["recommend (cached)"] = summarize(
+        time_calls(lambda: engine.recommend(ref, *hot(), cache=cache), repeat)
+    )
+
+    analysis = engine.analyze_soil(ref, *scalar(), LANG)
+    inorganic, organic = engine.recommend_fertilizer(ref, *scalar())
+    results["download_results"] = summarize(
+        time_calls(lambda: engine.download_results(analysis, inorganic, organic), repeat)
+    )
+
+    batch_repeat = max(3, repeat // 50)
+    results[f"analyze_batch ({len(ids):,} samples)"] = summarize(
+        time_calls(lambda: batch_analysis.analyze_batch(ref, ids, n, p, k), batch_repeat, warmup=1)
+    )
+    deficits = np.column_stack([n, p, k]).astype(np.float64)
+    solver = blend_solver.default_solver()
+    results[f"blend solve_batch ({len(ids):,} samples)"] = summarize(
+        time_calls(lambda: solver.solve_batch(deficits), batch_repeat, warmup=1)
+    )
+
+
+def bench_app(workdir, repeat, results):
+    """Full script reruns through Streamlit's AppTest, logged in with one analysis shown"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit not installed; skipping app reruns", file=sys.stderr)
+        return
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        at = AppTest.from_file(app_path, default_timeout=60).run()
+        at.sidebar.text_input[0].input("user00000000")
+        at.sidebar.text_input[1].input(BENCH_PASSWORD)
+        at.sidebar.button[0].click().run()
+        at.number_input[0].set_value(10).run()
+
+        results["app rerun (idle)"] = summarize(time_calls(lambda: at.run(), repeat))
+
+        def analyze():
+            at.button[0].click().run()
+
+        results["app rerun (analyze click)"] = summarize(time_calls(analyze, repeat))
+        if at.exception:
+            raise RuntimeError(f"app raised during benchmark: {at.exception[0].message}")
+    finally:
+        # The app's writers open their DB and archive paths lazily and
+        # relative to the cwd, so drain them before leaving workdir
+        dropped = history.close_all()
+        os.chdir(previous)
+    if dropped:
+        raise RuntimeError(f"app dropped {dropped} queued writes during benchmark")
+
+
+def compare(results, baseline, tolerance, min_delta_us):
+    """Cases whose p50 grew by more than tolerance x and more than min_delta_us"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        slower_by = stats["p50_us"] - base["p50_us"]
+        if stats["p50_us"] > base["p50_us"] * tolerance and slower_by > min_delta_us:
+            regressions.append((name, base["p50_us"], stats["p50_us"]))
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'case':45} {'n':>6} {'p50 us':>12} {'p90 us':>12} {'p99 us':>12} {'vs base':>8}")
+    for name, stats in results.items():
+        base = baseline.get(name)
+        ratio = f"{stats['p50_us'] / base['p50_us']:.2f}x" if base and base["p50_us"] else "-"
+        print(f"{name:45} {stats['n']:>6} {stats['p50_us']:>12.1f} {stats['p90_us']:>12.1f} "
+              f"{stats['p99_us']:>12.1f} {ratio:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the soil recommendation system")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=500, help="timed calls per micro-benchmark")
+    parser.add_argument("--app-repeat", type=int, default=20, help="timed full app reruns")
+    parser.add_argument("--skip-app", action="store_true", help="skip AppTest reruns")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p50 slowdown factor")
+    parser.add_argument("--min-delta-us", type=float, default=10.0,
+                        help="ignore p50 slowdowns smaller than this, which are timer noise")
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    params = SCALES[args.scale]
+    workdir = tempfile.mkdtemp(prefix="soil-bench-")
+    db_path = os.path.join(workdir, db_setup.DB_PATH)
+    try:
+        started = time.perf_counter()
+        crop_ids = build_database(db_path, params["soils"], params["crops_per_soil"], params["users"])
+        print(f"Built {args.scale} dataset in {time.perf_counter() - started:.1f}s: {params}", file=sys.stderr)
+
+        results = {}
+        ref = bench_db(db_path, params, args.repeat, results)
+        bench_math(ref, crop_ids, params, args.repeat, results)
+        if not args.skip_app:
+            bench_app(workdir, args.app_repeat, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get(args.scale, {})
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({args.scale: results}, f, indent=2)
+    if args.save_baseline:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+        stored[args.scale] = results
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_us)
+    for name, before, after in regressions:
+        print(f"REGRESSION {name}: p50 {before:.1f}us -> {after:.1f}us", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# blend_solver.py
+"""Cheapest blend of fertilizer products that covers an N/P/K deficit.
+
+Each sample is the linear program
+
+    minimize  price . x   subject to  content . x >= deficit,  x >= 0
+
+with x the kg of each product. Because every sample shares the same
+products and prices, only the deficit (the right-hand side) changes. The
+set of dual-feasible bases therefore depends on the prices alone, so it
+is enumerated once per solver. For a given deficit, the optimal blend is
+the dual-feasible basis that is also primal feasible and has the highest
+dual objective. That makes a batch solve a few small matrix products
+over (samples, bases) instead of one simplex run per sample.
+"""
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+from catalog import FERTILIZER_PRICES, INORGANIC_FERTILIZERS, NUTRIENTS, ORGANIC_FERTILIZERS
+
+DEFAULT_PRODUCTS = INORGANIC_FERTILIZERS + ORGANIC_FERTILIZERS
+# Samples per vectorized step; bounds the (samples, bases, nutrients) temporaries
+CHUNK_SIZE = 100_000
+
+
+class BlendSolver:
+    def __init__(self, products=DEFAULT_PRODUCTS, prices=FERTILIZER_PRICES):
+        self.products = [product["name"] for product in products]
+        missing = [name for name in self.products if name not in prices]
+        if missing:
+            raise ValueError(f"No price for {', '.join(missing)}")
+        # kg of nutrient per kg of product, (nutrients, products)
+        self.content = np.array(
+            [[product[nutrient] / 100 for product in products] for nutrient in NUTRIENTS],
+            dtype=np.float64,
+        )
+        self.prices = np.array([prices[name] for name in self.products], dtype=np.float64)
+        self._find_bases()
+
+    def _find_bases(self):
+        # Columns are the products followed by one surplus variable per nutrient
+        count = len(NUTRIENTS)
+        columns = np.hstack([self.content, -np.eye(count)])
+        costs = np.concatenate([self.prices, np.zeros(count)])
+        bases, inverses, duals = [], [], []
+        for basis in itertools.combinations(range(columns.shape[1]), count):
+            matrix = columns[:, basis]
+            if abs(np.linalg.det(matrix)) < 1e-12:
+                continue
+            inverse = np.linalg.inv(matrix)
+            dual = inverse.T @ costs[list(basis)]
+            reduced_costs = costs - columns.T @ dual
+            if (reduced_costs >= -1e-9).all():
+                bases.append(basis)
+                inverses.append(inverse)
+                duals.append(dual)
+        if not bases:
+            raise ValueError("Products cannot cover every nutrient at a finite cost")
+        self.bases = np.array(bases)
+        self.inverses = np.array(inverses)
+        self.duals = np.array(duals)
+
+    def solve_batch(self, deficits):
+        """kg of each product and total cost for an (samples, 3) deficit array.
+
+        Returns (amounts, cost) shaped (samples, products) and (samples,).
+        Rows with no feasible blend (a deficit no product supplies, or NaN
+        input) come back as NaN.
+        """
+        deficits = np.maximum(np.asarray(deficits, dtype=np.float64).reshape(-1, len(NUTRIENTS)), 0)
+        amounts = np.full((len(deficits), len(self.products)), np.nan)
+        for start in range(0, len(deficits), CHUNK_SIZE):
+            stop = start + CHUNK_SIZE
+            amounts[start:stop] = self._solve_chunk(deficits[start:stop])
+        return amounts, amounts @ self.prices
+
+    def _solve_chunk(self, deficits):
+        rows = np.arange(len(deficits))
+        # Basic variable values for every (sample, basis) pair
+        values = np.einsum("bij,sj->sbi", self.inverses, deficits)
+        tolerance = 1e-9 * (1 + np.abs(deficits).max(axis=1, initial=0))
+        feasible = (values >= -tolerance[:, None, None]).all(axis=2)
+        objective = np.where(feasible, deficits @ self.duals.T, -np.inf)
+        best = objective.argmax(axis=1)
+        solved = feasible[rows, best]
+
+        amounts = np.zeros((len(deficits), len(self.products)))
+        chosen = np.maximum(values[rows, best], 0)
+        for slot in range(len(NUTRIENTS)):
+            column = self.bases[best, slot]
+            is_product = column < len(self.products)
+            amounts[rows[is_product], column[is_product]] = chosen[is_product, slot]
+        amounts[~solved] = np.nan
+        return amounts
+
+    def solve(self, deficit):
+        """Blend for one (nitrogen, phosphorus, potassium) deficit, cached.
+
+        Returns {"items": [{"product", "kg", "cost"}], "cost"} with only the
+        products actually used, or None if no blend covers the deficit.
+        """
+        return self._solve_cached(tuple(float(max(0, d)) for d in deficit))
+
+    @lru_cache(maxsize=4096)
+    def _solve_cached(self, deficit):
+        amounts, cost = self.solve_batch(np.array([deficit]))
+        if np.isnan(cost[0]):
+            return None
+        return {
+            "items": [
+                {"product": name, "kg": float(kg), "cost": float(kg * price)}
+                for name, kg, price in zip(self.products, amounts[0], self.prices)
+                if kg > 1e-9
+            ],
+            "cost": float(cost[0]),
+        }
+
+
+@lru_cache(maxsize=1)
+def default_solver():
+    """Shared solver over every catalog product at the default prices"""
+    return BlendSolver()
@@ -0,0 +1,163 @@
+# bulk_upload.py
+"""Chunked processing of lab result files.
+
+Samples are read, analyzed and written out one chunk at a time so memory
+stays bounded by the chunk size regardless of how many rows a file has.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import batch_analysis
+
+DEFAULT_CHUNK_SIZE = 50_000
+LEVEL_COLUMNS = ["nitrogen", "phosphorus", "potassium"]
+
+
+class UploadError(ValueError):
+    pass
+
+
+def _normalize_columns(chunk):
+    chunk.columns = [str(c).strip().lower().replace(" ", "_") for c in chunk.columns]
+    return chunk
+
+
+def iter_csv_chunks(file, chunksize=DEFAULT_CHUNK_SIZE):
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        yield _normalize_columns(chunk)
+
+
+def iter_excel_chunks(file, chunksize=DEFAULT_CHUNK_SIZE):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise UploadError("Reading Excel files requires the openpyxl package")
+
+    # read_only streams rows from the sheet XML instead of loading it whole
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield _normalize_columns(pd.DataFrame(batch, columns=header))
+                batch = []
+        if batch:
+            yield _normalize_columns(pd.DataFrame(batch, columns=header))
+    finally:
+        workbook.close()
+
+
+def iter_sample_chunks(file, filename, chunksize=DEFAULT_CHUNK_SIZE):
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return iter_excel_chunks(file, chunksize)
+    return iter_csv_chunks(file, chunksize)
+
+
+@lru_cache(maxsize=4)
+def _crop_ids_by_name(catalog):
+    return {
+        (catalog.soil_names[crop["soil_id"]].lower(), crop["crop_name"].lower()): crop_id
+        for crop_id, crop in catalog.crops.items()
+        if crop["soil_id"] in catalog.soil_names
+    }
+
+
+def resolve_crop_ids(catalog, chunk):
+    """Crop ids from a crop_id column, or from soil_name + crop_name columns"""
+    if "crop_id" in chunk.columns:
+        return pd.to_numeric(chunk["crop_id"], errors="coerce").fillna(-1).astype("int64")
+    if "soil_name" in chunk.columns and "crop_name" in chunk.columns:
+        names = _crop_ids_by_name(catalog)
+        keys = zip(
+            chunk["soil_name"].astype(str).str.strip().str.lower(),
+            chunk["crop_name"].astype(str).str.strip().str.lower(),
+        )
+        return pd.Series([names.get(key, -1) for key in keys], index=chunk.index, dtype="int64")
+    raise UploadError("File needs a crop_id column or soil_name and crop_name columns")
+
+
+def analyze_chunk(catalog, chunk):
+    """The chunk's own columns, unchanged, followed by its analysis and a status column.
+
+    status is "ok" for analyzed rows. Otherwise it names the first problem
+    found (unknown_crop, invalid_level for a blank or non-numeric level,
+    negative_level, no_standard) and its balances and amounts are left blank.
+    """
+    missing = [c for c in LEVEL_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise UploadError(f"Missing columns: {', '.join(missing)}")
+
+    crop_ids = resolve_crop_ids(catalog, chunk).to_numpy()
+    levels = chunk[LEVEL_COLUMNS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+    invalid = np.isnan(levels).any(axis=1)
+    negative = (levels < 0).any(axis=1)
+    # A negative level is a data entry error, not a surplus to recommend against;
+    # rows with any unusable level get no partial recommendation either
+    levels[invalid | negative] = np.nan
+
+    results = batch_analysis.analyze_batch(catalog, crop_ids, levels[:, 0], levels[:, 1], levels[:, 2])
+    known_crop = np.isin(crop_ids, np.fromiter(catalog.crops, dtype=np.int64, count=len(catalog.crops)))
+    results["status"] = np.select(
+        [~known_crop, invalid, negative, ~results["has_standard"].to_numpy()],
+        ["unknown_crop", "invalid_level", "negative_level", "no_standard"],
+        "ok",
+    )
+    results = results.drop(columns=["crop_id"] + LEVEL_COLUMNS)
+    results.index = chunk.index
+    passthrough = chunk.drop(columns=[c for c in results.columns if c in chunk.columns])
+    return pd.concat([passthrough, results], axis=1)
+
+
+def archive_block(catalog, results):
+    """archive.make_block for the rows of an analyze_chunk frame whose status is ok.
+
+    Optional region and date columns are carried over; missing dates mean today.
+    """
+    import archive
+
+    known = results[(results["status"] == "ok").to_numpy()]
+    crop_ids = resolve_crop_ids(catalog, known).to_numpy()
+    soil_ids = np.array([catalog.crops[crop_id]["soil_id"] for crop_id in crop_ids], dtype=np.int32)
+    levels = known[LEVEL_COLUMNS].apply(pd.to_numeric).to_numpy(dtype=np.float64)
+    deficits = np.maximum(0, -known[[f"{n}_balance" for n in LEVEL_COLUMNS]].to_numpy(dtype=np.float64))
+    region = known["region"].fillna("").astype(str).str.strip().to_numpy() if "region" in known else None
+    day = None
+    if "date" in known:
+        dates = pd.to_datetime(known["date"], errors="coerce")
+        day = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+        day[dates.isna().to_numpy()] = archive.today()
+    return archive.make_block(soil_ids, crop_ids, levels, deficits, region, day)
+
+
+def process_file(catalog, file, filename, out, chunksize=DEFAULT_CHUNK_SIZE, progress=None, on_results=None):
+    """Stream analysis results for every row of file into out as CSV.
+
+    progress, if given, is called after each chunk with the fraction of the
+    input consumed (for CSV input) or None when that is unknown.
+    on_results, if given, receives each chunk's results frame.
+    Returns the number of rows written.
+    """
+    # Excel rows are decompressed lazily, so file position says nothing useful
+    total_bytes = None if filename.lower().endswith((".xlsx", ".xlsm")) else getattr(file, "size", None)
+    rows = 0
+    header = True
+    for chunk in iter_sample_chunks(file, filename, chunksize):
+        results = analyze_chunk(catalog, chunk)
+        results.to_csv(out, header=header, index=False, float_format="%.2f")
+        if on_results:
+            on_results(results)
+        header = False
+        rows += len(results)
+        if progress:
+            fraction = None
+            if total_bytes:
+                fraction = min(1.0, file.tell() / total_bytes)
+            progress(fraction, rows)
+    return rows
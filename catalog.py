@@ -0,0 +1,214 @@
+# catalog.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+import db_setup
+import metrics
+
+NUTRIENTS = ("nitrogen", "phosphorus", "potassium")
+
+# Nutrient content of each product, in percent by weight
+INORGANIC_FERTILIZERS = [
+    {"name": "Urea", "nitrogen": 46, "phosphorus": 0, "potassium": 0},
+    {"name": "DAP", "nitrogen": 18, "phosphorus": 46, "potassium": 0},
+    {"name": "MOP", "nitrogen": 0, "phosphorus": 0, "potassium": 60},
+]
+ORGANIC_FERTILIZERS = [
+    {"name": "Compost", "nitrogen": 2, "phosphorus": 1, "potassium": 1},
+    {"name": "Manure", "nitrogen": 1.5, "phosphorus": 1.2, "potassium": 0.8},
+]
+# Indicative retail prices in rupees per kg, used by the blend solver
+FERTILIZER_PRICES = {
+    "Urea": 5.9,
+    "DAP": 27.0,
+    "MOP": 34.0,
+    "Compost": 4.0,
+    "Manure": 2.5,
+}
+
+
+class Catalog:
+    """Immutable snapshot of soils, crops and nutrient standards"""
+
+    def __init__(self, version, soil_rows, crop_rows, standard_rows):
+        # Rows arrive sorted: soils by name, crops by (soil_id, crop_name)
+        self.version = version
+        self.soils = [{"id": row[0], "soil_name": row[1]} for row in soil_rows]
+        self.soil_ids = [s["id"] for s in self.soils]
+        self.soil_id_by_name = {s["soil_name"]: s["id"] for s in self.soils}
+        self.soil_names = {s["id"]: s["soil_name"] for s in self.soils}
+
+        self.crops = {}
+        self.crops_by_soil = {}
+        for crop_id, crop_name, soil_id in crop_rows:
+            crop = {"id": crop_id, "crop_name": crop_name, "soil_id": soil_id}
+            self.crops[crop_id] = crop
+            self.crops_by_soil.setdefault(soil_id, []).append(crop)
+        self.crop_ids_by_soil = {
+            soil_id: [c["id"] for c in crops] for soil_id, crops in self.crops_by_soil.items()
+        }
+
+        # Standards are keyed by (crop_id, soil_id); only a crop's own soil applies here
+        self.standards = {}
+        for crop_id, soil_id, nitrogen, phosphorus, potassium in standard_rows:
+            crop = self.crops.get(crop_id)
+            if crop and crop["soil_id"] == soil_id:
+                self.standards[crop_id] = {
+                    "nitrogen": nitrogen,
+                    "phosphorus": phosphorus,
+                    "potassium": potassium,
+                }
+
+    def rows(self):
+        """(soil_rows, crop_rows, standard_rows) that rebuild this catalog"""
+        soil_rows = [(s["id"], s["soil_name"]) for s in self.soils]
+        crop_rows = [(c["id"], c["crop_name"], c["soil_id"]) for c in self.crops.values()]
+        standard_rows = [
+            (crop_id, self.crops[crop_id]["soil_id"], std["nitrogen"], std["phosphorus"], std["potassium"])
+            for crop_id, std in self.standards.items()
+        ]
+        return soil_rows, crop_rows, standard_rows
+
+    def crop_name(self, crop_id):
+        return self.crops[crop_id]["crop_name"]
+
+    def standard_for(self, crop_id):
+        return self.standards.get(crop_id)
+
+
+def get_data_version(conn):
+    return conn.execute("SELECT version FROM reference_data_version WHERE id = 1").fetchone()[0]
+
+
+@metrics.timed("catalog.load_catalog")
+def load_catalog(conn):
+    version = get_data_version(conn)
+    soil_rows = conn.execute("SELECT id, soil_name FROM soiltypes ORDER BY soil_name").fetchall()
+    crop_rows = conn.execute(
+        "SELECT id, crop_name, soil_id FROM crops ORDER BY soil_id, crop_name"
+    ).fetchall()
+    standard_rows = conn.execute(
+        "SELECT crop_id, soil_id, nitrogen, phosphorus, potassium FROM crop_nutrient_standards"
+    ).fetchall()
+    return Catalog(version, soil_rows, crop_rows, standard_rows)
+
+
+# Snapshot
+SNAPSHOT_FORMAT = 2
+
+
+def _code_hash():
+    # Any edit to this module (Catalog, the load queries) invalidates old snapshots
+    try:
+        with open(__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+CODE_HASH = _code_hash()
+
+
+def snapshot_path(db_path):
+    return os.path.splitext(db_path)[0] + ".snapshot"
+
+
+def write_snapshot(catalog, path, schema_version):
+    """Atomically write the catalog's rows as JSON next to the database.
+
+    Rows are stored column by column (one list per field), which parses
+    about twice as fast as a list of row lists.
+    """
+    soil_rows, crop_rows, standard_rows = catalog.rows()
+    payload = {
+        "format": SNAPSHOT_FORMAT,
+        "code": CODE_HASH,
+        "schema": schema_version,
+        "version": catalog.version,
+        "soils": [list(column) for column in zip(*soil_rows)],
+        "crops": [list(column) for column in zip(*crop_rows)],
+        "standards": [list(column) for column in zip(*standard_rows)],
+    }
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_snapshot(path, schema_version, data_version):
+    """Catalog rebuilt from the snapshot at path, or None if it is missing, corrupt or stale"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        valid = (
+            CODE_HASH is not None
+            and payload["format"] == SNAPSHOT_FORMAT
+            and payload["code"] == CODE_HASH
+            and payload["schema"] == schema_version
+            and payload["version"] == data_version
+        )
+        if not valid:
+            return None
+        rows = [list(zip(*payload[name])) for name in ("soils", "crops", "standards")]
+        return Catalog(data_version, *rows)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+@metrics.timed("catalog.load_snapshot")
+def load_from_snapshot(conn, db_path):
+    """Catalog from the snapshot if it matches the DB's data and schema version, else from the DB.
+
+    A stale or missing snapshot is rebuilt, so only the first process after a
+    reference data change pays for the full load.
+    """
+    path = snapshot_path(db_path)
+    schema_version = db_setup.get_schema_version(conn)
+    cached = read_snapshot(path, schema_version, get_data_version(conn))
+    if cached is not None:
+        return cached
+    catalog = load_catalog(conn)
+    try:
+        write_snapshot(catalog, path, schema_version)
+    except OSError:
+        pass
+    return catalog
+
+
+class CatalogCache:
+    """Holds the current Catalog and reloads it when the data version moves.
+
+    The version is polled at most once per check_interval seconds, so
+    reads in between are plain attribute access with no DB round trip.
+    """
+
+    def __init__(self, pool, check_interval=30.0):
+        self.pool = pool
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        with pool.read() as conn:
+            self._catalog = load_from_snapshot(conn, pool.db_path)
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        return self._catalog
+
+    def refresh(self, force=False):
+        with self._lock:
+            with self.pool.read() as conn:
+                if force:
+                    self._catalog = load_catalog(conn)
+                elif get_data_version(conn) != self._catalog.version:
+                    self._catalog = load_from_snapshot(conn, self.pool.db_path)
+            self._checked_at = time.monotonic()
+        return self._catalog
@@ -0,0 +1,164 @@
+# db_pool.py
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import db_setup
+import metrics
+
+
+class ConnectionPool:
+    """Process-wide SQLite pool: concurrent readers, one serialized writer.
+
+    A connection is bound to the checking-out thread until it is returned,
+    and nested read() calls on the same thread reuse it.
+    """
+
+    def __init__(self, db_path=db_setup.DB_PATH, max_readers=8, busy_timeout_ms=5000,
+                 cached_statements=256, checkout_timeout=10.0, max_lock_retries=5):
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.checkout_timeout = checkout_timeout
+        self.max_lock_retries = max_lock_retries
+
+        db_setup.ensure_db(db_path)
+
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._writer = None
+        self._opened = 0
+        self._closed = False
+        self._stats = {
+            "connections": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "writes": 0,
+            "write_waits": 0,
+            "lock_retries": 0,
+        }
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        metrics.instrument_connection(conn)
+        with self._lock:
+            self._stats["connections"] += 1
+        return conn
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _checkout(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.max_readers
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except sqlite3.Error:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        self._count("waits")
+        try:
+            return self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled connection")
+
+    @contextmanager
+    def read(self):
+        """Check out a read connection for the current thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._checkout()
+        self._count("checkouts")
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def write(self):
+        """Hold the single writer connection; commits on success"""
+        if not self._writer_lock.acquire(blocking=False):
+            self._count("write_waits")
+            self._writer_lock.acquire()
+        try:
+            if self._writer is None:
+                self._writer = self._open()
+            conn = self._writer
+            self._count("writes")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            self._writer_lock.release()
+
+    def run_write(self, fn):
+        """Call fn(conn) inside write(), retrying if SQLite reports a lock"""
+        delay = 0.01
+        for attempt in range(self.max_lock_retries + 1):
+            try:
+                with self.write() as conn:
+                    return fn(conn)
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                if "locked" not in message and "busy" not in message:
+                    raise
+                if attempt == self.max_lock_retries:
+                    raise
+                self._count("lock_retries")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def execute_write(self, sql, params=()):
+        return self.run_write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["idle"] = self._idle.qsize()
+        stats["open_readers"] = self._opened
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
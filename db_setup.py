@@ -1,72 +1,252 @@
 # db_setup.py
 import sqlite3
+import threading
 
-def setup_db():
-    """Initialize database with all required tables and sample data"""
-    conn = None  # Initialize conn to None
+import metrics
+
+DB_PATH = 'soil_recommendation.db'
+
+
+def _migration_initial_schema(cursor):
+    """Create users, soil types and crops tables and seed reference data"""
+    tables = {
+        'users': """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL
+            )""",
+        'soiltypes': """
+            CREATE TABLE IF NOT EXISTS soiltypes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                soil_name TEXT UNIQUE NOT NULL
+            )""",
+        'crops': """
+            CREATE TABLE IF NOT EXISTS crops (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                crop_name TEXT NOT NULL,
+                soil_id INTEGER NOT NULL,
+                FOREIGN KEY (soil_id) REFERENCES soiltypes(id)
+            )"""
+    }
+
+    for table, schema in tables.items():
+        cursor.execute(schema)
+
+    # Insert soil types if empty
+    cursor.execute("SELECT COUNT(*) FROM soiltypes")
+    if cursor.fetchone()[0] == 0:
+        soils = [
+            ('Black Soil',), ('Laterite Soil',), ('Red Soil',),
+            ('Alluvial Soil',), ('Clay Soil',), ('Sandy Soil',),
+            ('Loamy Soil',)
+        ]
+        cursor.executemany("INSERT INTO soiltypes (soil_name) VALUES (?)", soils)
+
+    # Insert crops if empty
+    cursor.execute("SELECT COUNT(*) FROM crops")
+    if cursor.fetchone()[0] == 0:
+        crops = [
+            ('Rice', 1), ('Cotton', 1), ('Sugarcane', 1),
+            ('Tea', 2), ('Coffee', 2), ('Rubber', 2),
+            ('Groundnut', 3), ('Millets', 3), ('Tobacco', 3),
+            ('Wheat', 4), ('Rice', 4), ('Sugarcane', 4),
+            ('Paddy', 5), ('Jute', 5), ('Wheat', 5),
+            ('Coconut', 6), ('Groundnut', 6), ('Maize', 6),
+            ('Wheat', 7), ('Cotton', 7), ('Vegetables', 7)
+        ]
+        cursor.executemany("INSERT INTO crops (crop_name, soil_id) VALUES (?, ?)", crops)
+
+
+def _migration_reference_data_version(cursor):
+    """Track a counter that bumps whenever reference data changes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reference_data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )""")
+    cursor.execute("INSERT OR IGNORE INTO reference_data_version (id, version) VALUES (1, 1)")
+    for table in ('soiltypes', 'crops'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_bump_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE reference_data_version SET version = version + 1 WHERE id = 1;
+                END""")
+
+
+def _migration_crop_nutrient_standards(cursor):
+    """Key nutrient standards by crop and soil instead of list position"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS crop_nutrient_standards (
+            crop_id INTEGER NOT NULL,
+            soil_id INTEGER NOT NULL,
+            nitrogen REAL NOT NULL,
+            phosphorus REAL NOT NULL,
+            potassium REAL NOT NULL,
+            PRIMARY KEY (crop_id, soil_id),
+            FOREIGN KEY (crop_id) REFERENCES crops(id),
+            FOREIGN KEY (soil_id) REFERENCES soiltypes(id)
+        ) WITHOUT ROWID""")
+    # Covering index for loading every standard of a soil without table lookups
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_crop_nutrient_standards_soil
+        ON crop_nutrient_standards (soil_id, crop_id, nitrogen, phosphorus, potassium)""")
+    # Lets "WHERE soil_id = ? ORDER BY crop_name" walk the index instead of sorting
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crops_soil_name ON crops (soil_id, crop_name)")
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS crop_nutrient_standards_{event.lower()}_bump_version
+            AFTER {event} ON crop_nutrient_standards
+            BEGIN
+                UPDATE reference_data_version SET version = version + 1 WHERE id = 1;
+            END""")
+
+    # Seed standards (kg/acre) for the initial crops, in crop id order
+    cursor.execute("SELECT COUNT(*) FROM crop_nutrient_standards")
+    if cursor.fetchone()[0] == 0:
+        standards = [
+            (50, 30, 40), (45, 25, 35), (60, 40, 50),
+            (45, 25, 35), (50, 30, 40), (55, 35, 45),
+            (60, 40, 50), (50, 30, 40), (70, 50, 60),
+            (80, 60, 70), (75, 55, 65), (85, 65, 75),
+            (70, 50, 60), (65, 45, 55), (80, 60, 70),
+            (90, 70, 80), (60, 40, 50), (75, 55, 65),
+            (85, 65, 75), (70, 50, 60), (80, 60, 70)
+        ]
+        cursor.execute("SELECT id, soil_id FROM crops WHERE id <= ? ORDER BY id", (len(standards),))
+        rows = [
+            (crop_id, soil_id) + standards[crop_id - 1]
+            for crop_id, soil_id in cursor.fetchall()
+        ]
+        cursor.executemany(
+            "INSERT INTO crop_nutrient_standards (crop_id, soil_id, nitrogen, phosphorus, potassium) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def _migration_analyses(cursor):
+    """Persist each user's analyses for the history view"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analyses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            soil_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            nitrogen REAL NOT NULL,
+            phosphorus REAL NOT NULL,
+            potassium REAL NOT NULL,
+            result TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (soil_id) REFERENCES soiltypes(id),
+            FOREIGN KEY (crop_id) REFERENCES crops(id)
+        )""")
+    # Serves keyset pagination of one user's history, newest first
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyses_user_created ON analyses (user_id, created_at)")
+
+
+def _migration_analyses_created_index(cursor):
+    """Index analyses by date for reports that span every user"""
+    # The implicit rowid suffix also serves the (created_at, id) keyset order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at)")
+
+
+# Ordered schema migrations. Migration N brings the database to
+# schema version N, which is recorded in PRAGMA user_version.
+# Never edit or reorder an applied migration; append a new one instead.
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_reference_data_version,
+    _migration_crop_nutrient_standards,
+    _migration_analyses,
+    _migration_analyses_created_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def connect(db_path=DB_PATH):
+    """Open a connection to an already-migrated database"""
+    return metrics.instrument_connection(sqlite3.connect(db_path))
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@metrics.timed("db_setup.migrate")
+def migrate(conn):
+    """Apply pending migrations and return the number applied"""
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    # Take the write lock before re-reading the version so that concurrent
+    # processes bootstrapping the same file apply each migration only once
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        conn = sqlite3.connect('soil_recommendation.db')
+        version = get_schema_version(conn)
         cursor = conn.cursor()
+        for migration in MIGRATIONS[version:]:
+            migration(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+        return max(0, SCHEMA_VERSION - version)
+    except sqlite3.Error:
+        conn.rollback()
+        raise
 
-        # Create tables with error handling
-        tables = {
-            'users': """
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL
-                )""",
-            'soiltypes': """
-                CREATE TABLE IF NOT EXISTS soiltypes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    soil_name TEXT UNIQUE NOT NULL
-                )""",
-            'crops': """
-                CREATE TABLE IF NOT EXISTS crops (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    crop_name TEXT NOT NULL,
-                    soil_id INTEGER NOT NULL,
-                    FOREIGN KEY (soil_id) REFERENCES soiltypes(id)
-                )"""
-        }
-
-        for table, schema in tables.items():
-            cursor.execute(schema)
-
-        # Insert soil types if empty
-        cursor.execute("SELECT COUNT(*) FROM soiltypes")
-        if cursor.fetchone()[0] == 0:
-            soils = [
-                ('Black Soil',), ('Laterite Soil',), ('Red Soil',),
-                ('Alluvial Soil',), ('Clay Soil',), ('Sandy Soil',),
-                ('Loamy Soil',)
-            ]
-            cursor.executemany("INSERT INTO soiltypes (soil_name) VALUES (?)", soils)
-
-        # Insert crops if empty
-        cursor.execute("SELECT COUNT(*) FROM crops")
-        if cursor.fetchone()[0] == 0:
-            crops = [
-                ('Rice', 1), ('Cotton', 1), ('Sugarcane', 1),
-                ('Tea', 2), ('Coffee', 2), ('Rubber', 2),
-                ('Groundnut', 3), ('Millets', 3), ('Tobacco', 3),
-                ('Wheat', 4), ('Rice', 4), ('Sugarcane', 4),
-                ('Paddy', 5), ('Jute', 5), ('Wheat', 5),
-                ('Coconut', 6), ('Groundnut', 6), ('Maize', 6),
-                ('Wheat', 7), ('Cotton', 7), ('Vegetables', 7)
-            ]
-            cursor.executemany("INSERT INTO crops (crop_name, soil_id) VALUES (?, ?)", crops)
 
-        conn.commit()
-        print("Database setup completed successfully")
+def ensure_db(db_path=DB_PATH):
+    """Run migrations once per process for db_path"""
+    if db_path in _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if db_path in _bootstrapped:
+            return
+        conn = connect(db_path)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _bootstrapped.add(db_path)
+
+
+def build_snapshot(conn, db_path=DB_PATH):
+    """Write the reference-data snapshot app processes load at startup"""
+    import catalog
+
+    try:
+        catalog.write_snapshot(catalog.load_catalog(conn), catalog.snapshot_path(db_path), get_schema_version(conn))
+    except OSError as e:
+        print(f"Could not write reference snapshot: {e}")
+
+
+@metrics.timed("db_setup.setup_db")
+def setup_db(db_path=DB_PATH):
+    """Initialize database with all required tables and sample data"""
+    conn = None  # Initialize conn to None
+    try:
+        conn = connect(db_path)
+        applied = migrate(conn)
+        _bootstrapped.add(db_path)
+        build_snapshot(conn, db_path)
+        if applied:
+            print(f"Database setup completed successfully (schema version {SCHEMA_VERSION})")
+        else:
+            print(f"Database already at schema version {SCHEMA_VERSION}")
         return conn
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         if conn:
-            conn.rollback()  # Rollback changes on error
+            conn.close()
         raise
-    finally:
-        pass # Connection is returned, closing is handled in app.py
+
 
 if __name__ == "__main__":
-    setup_db()
+    setup_db().close()
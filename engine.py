@@ -0,0 +1,221 @@
+# engine.py
+"""Soil analysis and fertilizer recommendation logic.
+
+Nothing here imports Streamlit, so the same code backs app.py, the HTTP
+service and offline tools. Callers pass in the ConnectionPool and Catalog.
+"""
+import io
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+from catalog import INORGANIC_FERTILIZERS, NUTRIENTS, ORGANIC_FERTILIZERS
+
+NUTRIENT_LABELS = {
+    "nitrogen": "Nitrogen",
+    "phosphorus": "Phosphorus",
+    "potassium": "Potassium",
+}
+
+
+# Analysis
+def nutrient_balance(std, n, p, k):
+    """Signed level - standard per nutrient; positive is excess"""
+    return {
+        "nitrogen": n - std["nitrogen"],
+        "phosphorus": p - std["phosphorus"],
+        "potassium": k - std["potassium"],
+    }
+
+
+def fertilizer_amounts(std, n, p, k):
+    """kg of each product per deficient nutrient, as (inorganic, organic) lists.
+
+    Items are {"product", "nutrient", "kg"} dicts in product, then nutrient order.
+    Each covers one nutrient with one product on its own, so they are
+    alternatives rather than amounts to apply together; cheapest_blend()
+    is the combined recommendation.
+    """
+    deficiency = {
+        "nitrogen": max(0, std["nitrogen"] - n),
+        "phosphorus": max(0, std["phosphorus"] - p),
+        "potassium": max(0, std["potassium"] - k),
+    }
+
+    def amounts(products):
+        items = []
+        for product in products:
+            for nutrient in NUTRIENTS:
+                if product[nutrient] > 0 and deficiency[nutrient]:
+                    items.append({
+                        "product": product["name"],
+                        "nutrient": nutrient,
+                        "kg": (deficiency[nutrient] / product[nutrient]) * 100,
+                    })
+        return items
+
+    return amounts(INORGANIC_FERTILIZERS), amounts(ORGANIC_FERTILIZERS)
+
+
+def cheapest_blend(std, n, p, k):
+    """Lowest-cost mix of all products covering the deficit, or None"""
+    # numpy is only needed once a sample is analyzed, not to render the login page
+    import blend_solver
+
+    deficit = (std["nitrogen"] - n, std["phosphorus"] - p, std["potassium"] - k)
+    return blend_solver.default_solver().solve(deficit)
+
+
+@metrics.timed("engine.evaluate")
+def evaluate(std, n, p, k):
+    """Structured analysis and recommendation for one sample"""
+    inorganic, organic = fertilizer_amounts(std, n, p, k)
+    return {
+        "standard": dict(std),
+        "balance": nutrient_balance(std, n, p, k),
+        "inorganic": inorganic,
+        "organic": organic,
+        "blend": cheapest_blend(std, n, p, k),
+    }
+
+
+class RecommendationCache:
+    """Bounded, thread-safe LRU of evaluate() results.
+
+    Keys include the catalog version, so entries computed against old
+    standards are never served after the reference data changes; they
+    simply age out. Cached results are shared and must not be mutated.
+    """
+
+    def __init__(self, maxsize=10_000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@metrics.timed("engine.recommend")
+def recommend(catalog, crop_id, n, p, k, cache=None):
+    """evaluate() for a crop id, or None if the crop has no standard"""
+    std = catalog.standard_for(crop_id)
+    if not std:
+        return None
+    if cache is None:
+        return evaluate(std, n, p, k)
+    return cache.get_or_compute((crop_id, n, p, k, catalog.version), lambda: evaluate(std, n, p, k))
+
+
+def format_status(balance, lang):
+    if balance > 0:
+        return f"{lang['excess_by']} {balance:.2f}"
+    if balance < 0:
+        return f"{lang['deficient_by']} {-balance:.2f}"
+    return lang["balanced"]
+
+
+def format_analysis(balance, lang):
+    return {NUTRIENT_LABELS[nutrient]: format_status(balance[nutrient], lang) for nutrient in NUTRIENTS}
+
+
+def format_amounts(items):
+    return [
+        f"{item['product']} for {NUTRIENT_LABELS[item['nutrient']]}: {item['kg']:.2f} kg"
+        for item in items
+    ]
+
+
+def format_blend(blend):
+    return [
+        f"{item['product']}: {item['kg']:.2f} kg (₹{item['cost']:.2f})"
+        for item in blend["items"]
+    ]
+
+
+def analyze_soil(catalog, crop_id, n, p, k, lang):
+    std = catalog.standard_for(crop_id)
+    if std:
+        return format_analysis(nutrient_balance(std, n, p, k), lang)
+    return None
+
+
+def recommend_fertilizer(catalog, crop_id, n, p, k):
+    std = catalog.standard_for(crop_id)
+    if std:
+        inorganic, organic = fertilizer_amounts(std, n, p, k)
+        return format_amounts(inorganic), format_amounts(organic)
+    return [], []
+
+
+def write_results(out, analysis_results, inorganic_recommendations, organic_recommendations,
+                  blend=None, now=None):
+    """Stream the plain-text report for one sample into out"""
+    now = now or datetime.now()
+    out.write("Soil Analysis and Fertilizer Recommendation\n")
+    out.write(f"Date: {now.strftime('%Y-%m-%d')}\n")
+    out.write(f"Time: {now.strftime('%H:%M:%S')}\n")
+    out.write(f"Day: {now.strftime('%A')}\n")
+    out.write(f"Year: {now.strftime('%Y')}\n\n")
+
+    def section(title, lines, empty):
+        out.write(title)
+        if lines:
+            for line in lines:
+                out.write(f"- {line}\n")
+        else:
+            out.write(empty)
+
+    section(
+        "Analysis Results:\n",
+        [f"{nutrient}: {status}" for nutrient, status in (analysis_results or {}).items()],
+        "No analysis performed.\n",
+    )
+    if blend is not None:
+        section("\nRecommended Blend (lowest cost):\n", format_blend(blend), "No fertilizer needed.\n")
+        if blend["items"]:
+            out.write(f"Total cost: ₹{blend['cost']:.2f}\n")
+    # One product per nutrient on its own; the amounts do not add up to a plan
+    section("\nSingle-Product Alternatives, Inorganic:\n", inorganic_recommendations,
+            "No inorganic fertilizer recommendations.\n")
+    section("\nSingle-Product Alternatives, Organic:\n", organic_recommendations,
+            "No organic fertilizer recommendations.\n")
+
+
+@metrics.timed("engine.download_results")
+def download_results(analysis_results, inorganic_recommendations, organic_recommendations, blend=None):
+    out = io.StringIO()
+    write_results(out, analysis_results, inorganic_recommendations, organic_recommendations, blend)
+    return out.getvalue()
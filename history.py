@@ -0,0 +1,222 @@
+# history.py
+"""Saved analyses: batched write-behind inserts and keyset-paginated reads."""
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import metrics
+
+DEFAULT_PAGE_SIZE = 20
+
+logger = logging.getLogger(__name__)
+# Queued by close() to stop the writer thread
+_STOP = object()
+# Every queue not yet garbage collected, for tools that must drain them
+_queues = weakref.WeakSet()
+
+
+class WriteBehindQueue:
+    """Collects items on a background thread and hands them to flush in batches.
+
+    A batch is written once max_batch items are waiting or flush_interval
+    seconds have passed since its first item. put() blocks only when
+    max_queue items are already pending, which pushes back on producers
+    if the DB falls behind.
+
+    A batch that fails because the store is unavailable (a locked DB, a
+    full disk) is retried with backoff, but only until the store has been
+    failing for max_retry_seconds; after that batches are dropped and
+    counted instead of stalling the writer and every put() behind it. Any
+    other error is taken to be bad data, and the batch is split so one bad
+    item cannot take the rest of its batch with it.
+    """
+
+    # Errors that mean "try again later" rather than "this data is bad"
+    transient_errors = (sqlite3.OperationalError, OSError)
+
+    def __init__(self, flush, max_batch=500, flush_interval=1.0, max_queue=10_000, name="write-behind",
+                 max_retry_seconds=30.0, retry_delay=0.1):
+        self._flush = flush
+        self.name = name
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retry_seconds = max_retry_seconds
+        self.retry_delay = retry_delay
+        self._failing_since = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "errors": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        _queues.add(self)
+
+    def put(self, item):
+        if self._closed:
+            raise RuntimeError("Write-behind queue is closed")
+        self._queue.put(item)
+        self._count("queued")
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def flush(self, timeout=None):
+        """Write everything queued before this call now; False if timeout passes first"""
+        if self._closed:
+            return True
+        # A marker in the queue: the writer sets it once the items ahead of it are written
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        batch, waiters, deadline = [], [], None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # flush_interval has passed since the batch's first item
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None and item is not _STOP:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.max_batch:
+                    continue
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            batch, waiters, deadline = [], [], None
+            if item is _STOP:
+                return
+
+    def _write(self, batch):
+        delay = self.retry_delay
+        while True:
+            try:
+                self._flush(batch)
+            except self.transient_errors:
+                self._count("errors")
+                now = time.monotonic()
+                if self._failing_since is None:
+                    self._failing_since = now
+                # The budget runs from the start of the outage, so later batches fail fast
+                if now + delay - self._failing_since > self.max_retry_seconds:
+                    logger.error("Write-behind store has been failing for %.1fs", now - self._failing_since,
+                                 exc_info=True)
+                    self._drop(batch)
+                    return
+                logger.warning("Write-behind flush of %d items failed; retrying in %.1fs", len(batch), delay,
+                               exc_info=True)
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            except Exception:
+                self._count("errors")
+                if len(batch) == 1:
+                    logger.error("Write-behind rejected an item: %r", batch[0], exc_info=True)
+                    self._drop(batch)
+                    return
+                # Bad data; halve until the offending items are isolated
+                middle = len(batch) // 2
+                self._write(batch[:middle])
+                self._write(batch[middle:])
+                return
+            self._failing_since = None
+            self._count("written", len(batch))
+            self._count("batches")
+            return
+
+    def _drop(self, batch):
+        self._count("dropped", len(batch))
+        metrics.inc("write_behind_dropped_total", {"queue": self.name}, len(batch))
+        logger.error("Write-behind %s dropped %d items", self.name, len(batch))
+
+
+def close_all():
+    """Close every live write-behind queue; returns how many items they dropped"""
+    queues = list(_queues)
+    for q in queues:
+        q.close()
+    return sum(q.stats["dropped"] for q in queues)
+
+
+@metrics.timed("history.insert_analyses")
+def insert_analyses(pool, rows):
+    pool.run_write(lambda conn: conn.executemany(
+        "INSERT INTO analyses "
+        "(user_id, soil_id, crop_id, nitrogen, phosphorus, potassium, result, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    ))
+
+
+class AnalysisWriter(WriteBehindQueue):
+    def __init__(self, pool, **kwargs):
+        super().__init__(lambda rows: insert_analyses(pool, rows), name="analysis-writer", **kwargs)
+
+    def record(self, user_id, soil_id, crop_id, n, p, k, result):
+        created_at = datetime.now().isoformat(sep=" ", timespec="microseconds")
+        self.put((user_id, soil_id, crop_id, n, p, k, json.dumps(result), created_at))
+
+
+@metrics.timed("history.fetch_history")
+def fetch_history(pool, user_id, before=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of a user's analyses, newest first.
+
+    before is the (created_at, id) cursor of the last row of the previous
+    page. Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    sql = (
+        "SELECT id, soil_id, crop_id, nitrogen, phosphorus, potassium, result, created_at "
+        "FROM analyses WHERE user_id = ?"
+    )
+    params = [user_id]
+    if before is not None:
+        # Row-value comparison lets SQLite seek the (user_id, created_at) index
+        sql += " AND (created_at, id) < (?, ?)"
+        params += [before[0], before[1]]
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with pool.read() as conn:
+        fetched = conn.execute(sql, params).fetchall()
+
+    rows = [
+        {
+            "id": row[0],
+            "soil_id": row[1],
+            "crop_id": row[2],
+            "nitrogen": row[3],
+            "phosphorus": row[4],
+            "potassium": row[5],
+            "result": json.loads(row[6]),
+            "created_at": row[7],
+        }
+        for row in fetched[:limit]
+    ]
+    next_cursor = None
+    if len(fetched) > limit:
+        next_cursor = (rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
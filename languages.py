@@ -0,0 +1,234 @@
+# languages.py
+"""UI strings for every supported language.
+
+Kept out of app.py so the table is built once per process at import,
+not on every Streamlit rerun.
+"""
+language_options = ["English", "Hindi", "Kannada"]
+language_map = {
+    "English": {
+        "menu": "Menu",
+        "login": "Login",
+        "register": "Register",
+        "create_account": "Create Account",
+        "username": "Username",
+        "password": "Password",
+        "register_button": "Register",
+        "login_button": "Login",
+        "invalid_credentials": "Invalid credentials",
+        "welcome": "Welcome",
+        "soil_type": "Select Soil Type",
+        "no_soil_found": "No soil types found in database",
+        "crop": "Select Crop",
+        "no_crop_found": "No crops found for selected soil type",
+        "nutrient_levels": "Soil Nutrient Levels",
+        "nitrogen": "Nitrogen (kg/acre)",
+        "phosphorus": "Phosphorus (kg/acre)",
+        "potassium": "Potassium (kg/acre)",
+        "analyze_recommend": "Analyze & Recommend",
+        "reset": "Reset",
+        "analysis_results": "Analysis Results",
+        "alternatives_inorganic": "Inorganic",
+        "alternatives_organic": "Organic",
+        "download_results": "Download Results",
+        "excess_by": "Excess by",
+        "deficient_by": "Deficient by",
+        "balanced": "Balanced",
+        "no_nutrient_data": "No standard nutrient data found for this crop.",
+        "crop_determination_failed": "Could not determine the selected crop.",
+        "download_file_name": "soil_analysis_results",
+        "register_exists": "already exists",
+        "page": "Page",
+        "single_sample": "Single Sample",
+        "bulk_upload": "Bulk Upload",
+        "bulk_upload_help": "Upload a CSV or Excel file with nitrogen, phosphorus and potassium columns, plus crop_id or soil_name and crop_name.",
+        "upload_file": "Lab results file",
+        "process_file": "Process File",
+        "rows_processed": "rows processed",
+        "rows_skipped": "rows could not be analyzed; the status column in the results says why",
+        "history": "History",
+        "no_history": "No saved analyses yet.",
+        "newer": "Newer",
+        "older": "Older",
+        "date": "Date",
+        "soil_column": "Soil",
+        "crop_column": "Crop",
+        "metrics": "Metrics",
+        "metrics_disabled": "Metrics are disabled. Start the app with SOIL_METRICS=1 to collect them.",
+        "unexpected_error": "An unexpected error occurred. It has been logged.",
+        "cheapest_blend": "Recommended Fertilizer Blend (lowest cost)",
+        "blend_cost": "Total cost",
+        "no_blend_needed": "No fertilizer needed.",
+        "dashboard": "Dashboard",
+        "region": "Region (optional)",
+        "all_regions": "All regions",
+        "nutrient": "Nutrient",
+        "total_samples": "Samples archived",
+        "mean_deficit_by_soil": "Mean deficit by soil type per month",
+        "deficient_share_by_crop": "Share of deficient samples per crop",
+        "no_archive_data": "No samples have been archived yet.",
+        "season_report": "Season Report",
+        "start_date": "From",
+        "end_date": "To",
+        "report_format": "Format",
+        "all_users": "All users",
+        "generate_report": "Generate Report",
+        "report_pending": "Generating report…",
+        "report_failed": "Report failed",
+        "report_busy": "Too many reports are being generated. Please try again shortly.",
+        "logout": "Logout",
+        "login_busy": "Too many logins right now; please try again in a moment.",
+        "single_product_alternatives": "Single-product alternatives",
+        "alternatives_note": "Each line covers one nutrient with one product on its own. Use one line per nutrient instead of the blend; the amounts do not add up.",
+    },
+    "Hindi": {
+        "menu": "मेनू",
+        "login": "लॉगिन",
+        "register": "रजिस्टर",
+        "create_account": "खाता बनाएँ",
+        "username": "उपयोगकर्ता नाम",
+        "password": "पासवर्ड",
+        "register_button": "रजिस्टर करें",
+        "login_button": "लॉगिन करें",
+        "invalid_credentials": "अमान्य क्रेडेंशियल",
+        "welcome": "स्वागत है",
+        "soil_type": "मिट्टी का प्रकार चुनें",
+        "no_soil_found": "डेटाबेस में कोई मिट्टी का प्रकार नहीं मिला",
+        "crop": "फसल चुनें",
+        "no_crop_found": "चयनित मिट्टी के प्रकार के लिए कोई फसल नहीं मिली",
+        "nutrient_levels": "मिट्टी पोषक तत्व स्तर",
+        "nitrogen": "नाइट्रोजन (किलोग्राम/एकड़)",
+        "phosphorus": "फास्फोरस (किलोग्राम/एकड़)",
+        "potassium": "पोटेशियम (किलोग्राम/एकड़)",
+        "analyze_recommend": "विश्लेषण और सिफारिश करें",
+        "reset": "रीसेट",
+        "analysis_results": "विश्लेषण परिणाम",
+        "alternatives_inorganic": "अकार्बनिक",
+        "alternatives_organic": "कार्बनिक",
+        "download_results": "परिणाम डाउनलोड करें",
+        "excess_by": "से अधिक",
+        "deficient_by": "से कम",
+        "balanced": "संतुलित",
+        "no_nutrient_data": "इस फसल के लिए कोई मानक पोषक तत्व डेटा नहीं मिला।",
+        "crop_determination_failed": "चयनित फसल का निर्धारण नहीं किया जा सका।",
+        "download_file_name": "मृदा_विश्लेषण_परिणाम",
+        "register_exists": "पहले से मौजूद है",
+        "page": "पृष्ठ",
+        "single_sample": "एकल नमूना",
+        "bulk_upload": "थोक अपलोड",
+        "bulk_upload_help": "nitrogen, phosphorus और potassium कॉलम तथा crop_id या soil_name और crop_name कॉलम वाली CSV या Excel फ़ाइल अपलोड करें।",
+        "upload_file": "प्रयोगशाला परिणाम फ़ाइल",
+        "process_file": "फ़ाइल संसाधित करें",
+        "rows_processed": "पंक्तियाँ संसाधित",
+        "rows_skipped": "पंक्तियों का विश्लेषण नहीं हो सका; कारण परिणामों के status कॉलम में है",
+        "history": "इतिहास",
+        "no_history": "अभी तक कोई सहेजा गया विश्लेषण नहीं है।",
+        "newer": "नए",
+        "older": "पुराने",
+        "date": "तारीख",
+        "soil_column": "मिट्टी",
+        "crop_column": "फसल",
+        "metrics": "मेट्रिक्स",
+        "metrics_disabled": "मेट्रिक्स बंद हैं। इन्हें एकत्र करने के लिए ऐप को SOIL_METRICS=1 के साथ शुरू करें।",
+        "unexpected_error": "एक अनपेक्षित त्रुटि हुई। इसे लॉग कर लिया गया है।",
+        "cheapest_blend": "अनुशंसित उर्वरक मिश्रण (सबसे कम लागत)",
+        "blend_cost": "कुल लागत",
+        "no_blend_needed": "किसी उर्वरक की आवश्यकता नहीं है।",
+        "dashboard": "डैशबोर्ड",
+        "region": "क्षेत्र (वैकल्पिक)",
+        "all_regions": "सभी क्षेत्र",
+        "nutrient": "पोषक तत्व",
+        "total_samples": "संग्रहीत नमूने",
+        "mean_deficit_by_soil": "प्रति माह मिट्टी के प्रकार अनुसार औसत कमी",
+        "deficient_share_by_crop": "प्रति फसल कमी वाले नमूनों का हिस्सा",
+        "no_archive_data": "अभी तक कोई नमूना संग्रहीत नहीं हुआ है।",
+        "season_report": "सीज़न रिपोर्ट",
+        "start_date": "से",
+        "end_date": "तक",
+        "report_format": "प्रारूप",
+        "all_users": "सभी उपयोगकर्ता",
+        "generate_report": "रिपोर्ट बनाएं",
+        "report_pending": "रिपोर्ट बन रही है…",
+        "report_failed": "रिपोर्ट विफल रही",
+        "report_busy": "बहुत सारी रिपोर्टें बन रही हैं। कृपया थोड़ी देर बाद पुनः प्रयास करें।",
+        "logout": "लॉग आउट",
+        "login_busy": "इस समय बहुत अधिक लॉगिन हो रहे हैं; कृपया थोड़ी देर बाद पुनः प्रयास करें।",
+        "single_product_alternatives": "एकल-उत्पाद विकल्प",
+        "alternatives_note": "प्रत्येक पंक्ति एक ही उत्पाद से एक पोषक तत्व की पूर्ति करती है। मिश्रण के बजाय प्रति पोषक तत्व एक पंक्ति का उपयोग करें; मात्राएँ जोड़ी नहीं जातीं।",
+    },
+    "Kannada": {
+        "menu": "ಮೆನು",
+        "login": "ಲಾಗ್ ಇನ್",
+        "register": "ನೋಂದಾಯಿಸಿ",
+        "create_account": "ಖಾತೆ ರಚಿಸಿ",
+        "username": "ಬಳಕೆದಾರ ಹೆಸರು",
+        "password": "ಗುಪ್ತಪದ",
+        "register_button": "ನೋಂದಾಯಿಸಿ",
+        "login_button": "ಲಾಗ್ ಇನ್",
+        "invalid_credentials": "ಅಮಾನ್ಯ ರುಜುವಾತುಗಳು",
+        "welcome": "ಸ್ವಾಗತ",
+        "soil_type": "ಮಣ್ಣಿನ ಪ್ರಕಾರವನ್ನು ಆಯ್ಕೆ ಮಾಡಿ",
+        "no_soil_found": "ಡೇಟಾಬೇಸ್‌ನಲ್ಲಿ ಯಾವುದೇ ಮಣ್ಣಿನ ಪ್ರಕಾರಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
+        "crop": "ಬೆಳೆ ಆಯ್ಕೆ ಮಾಡಿ",
+        "no_crop_found": "ಆಯ್ಕೆ ಮಾಡಿದ ಮಣ್ಣಿನ ಪ್ರಕಾರಕ್ಕೆ ಯಾವುದೇ ಬೆಳೆಗಳು ಕಂಡುಬಂದಿಲ್ಲ",
+        "nutrient_levels": "ಮಣ್ಣಿನ ಪೋಷಕಾಂಶಗಳ ಮಟ್ಟಗಳು",
+        "nitrogen": "ಸಾರಜನಕ (ಕೆಜಿ/ಎಕರೆ)",
+        "phosphorus": "ರಂಜಕ (ಕೆಜಿ/ಎಕರೆ)",
+        "potassium": "ಪೊಟ್ಯಾಸಿಯಮ್ (ಕೆಜಿ/ಎಕರೆ)",
+        "analyze_recommend": "ವಿಶ್ಲೇಷಿಸಿ ಮತ್ತು ಶಿಫಾರಸು ಮಾಡಿ",
+        "reset": "ಮರುಹೊಂದಿಸಿ",
+        "analysis_results": "ವಿಶ್ಲೇಷಣೆ ಫಲಿತಾಂಶಗಳು",
+        "alternatives_inorganic": "ಅಜೈವಿಕ",
+        "alternatives_organic": "ಸಾವಯವ",
+        "download_results": "ಫಲಿತಾಂಶಗಳನ್ನು ಡೌನ್‌ಲೋಡ್ ಮಾಡಿ",
+        "excess_by": "ಇಂದ ಹೆಚ್ಚುವರಿ",
+        "deficient_by": "ಇಂದ ಕೊರತೆ",
+        "balanced": "ಸಮತೋಲಿತ",
+        "no_nutrient_data": "ಈ ಬೆಳೆಗೆ ಯಾವುದೇ ಪ್ರಮಾಣಿತ ಪೋಷಕಾಂಶ ದತ್ತಾಂಶ ಕಂಡುಬಂದಿಲ್ಲ.",
+        "crop_determination_failed": "ಆಯ್ಕೆ ಮಾಡಿದ ಬೆಳೆಯನ್ನು ನಿರ್ಧರಿಸಲು ಸಾಧ್ಯವಾಗಲಿಲ್ಲ.",
+        "download_file_name": "ಮಣ್ಣಿನ_ವಿಶ್ಲೇಷಣೆ_ಫಲಿತಾಂಶಗಳು",
+        "register_exists": "ಈಗಾಗಲೇ ಅಸ್ತಿತ್ವದಲ್ಲಿದೆ",
+        "page": "ಪುಟ",
+        "single_sample": "ಏಕ ಮಾದರಿ",
+        "bulk_upload": "ಬೃಹತ್ ಅಪ್‌ಲೋಡ್",
+        "bulk_upload_help": "nitrogen, phosphorus ಮತ್ತು potassium ಕಾಲಮ್‌ಗಳು ಹಾಗೂ crop_id ಅಥವಾ soil_name ಮತ್ತು crop_name ಕಾಲಮ್‌ಗಳಿರುವ CSV ಅಥವಾ Excel ಫೈಲ್ ಅಪ್‌ಲೋಡ್ ಮಾಡಿ.",
+        "upload_file": "ಪ್ರಯೋಗಾಲಯ ಫಲಿತಾಂಶ ಫೈಲ್",
+        "process_file": "ಫೈಲ್ ಸಂಸ್ಕರಿಸಿ",
+        "rows_processed": "ಸಾಲುಗಳನ್ನು ಸಂಸ್ಕರಿಸಲಾಗಿದೆ",
+        "rows_skipped": "ಸಾಲುಗಳನ್ನು ವಿಶ್ಲೇಷಿಸಲಾಗಲಿಲ್ಲ; ಕಾರಣ ಫಲಿತಾಂಶಗಳ status ಕಾಲಮ್‌ನಲ್ಲಿದೆ",
+        "history": "ಇತಿಹಾಸ",
+        "no_history": "ಇನ್ನೂ ಯಾವುದೇ ಉಳಿಸಿದ ವಿಶ್ಲೇಷಣೆಗಳಿಲ್ಲ.",
+        "newer": "ಹೊಸದು",
+        "older": "ಹಳೆಯದು",
+        "date": "ದಿನಾಂಕ",
+        "soil_column": "ಮಣ್ಣು",
+        "crop_column": "ಬೆಳೆ",
+        "metrics": "ಮೆಟ್ರಿಕ್ಸ್",
+        "metrics_disabled": "ಮೆಟ್ರಿಕ್ಸ್ ನಿಷ್ಕ್ರಿಯವಾಗಿವೆ. ಅವುಗಳನ್ನು ಸಂಗ್ರಹಿಸಲು SOIL_METRICS=1 ನೊಂದಿಗೆ ಆ್ಯಪ್ ಪ್ರಾರಂಭಿಸಿ.",
+        "unexpected_error": "ಅನಿರೀಕ್ಷಿತ ದೋಷ ಸಂಭವಿಸಿದೆ. ಅದನ್ನು ದಾಖಲಿಸಲಾಗಿದೆ.",
+        "cheapest_blend": "ಶಿಫಾರಸು ಮಾಡಲಾದ ರಸಗೊಬ್ಬರ ಮಿಶ್ರಣ (ಕಡಿಮೆ ವೆಚ್ಚ)",
+        "blend_cost": "ಒಟ್ಟು ವೆಚ್ಚ",
+        "no_blend_needed": "ಯಾವುದೇ ರಸಗೊಬ್ಬರದ ಅಗತ್ಯವಿಲ್ಲ.",
+        "dashboard": "ಡ್ಯಾಶ್‌ಬೋರ್ಡ್",
+        "region": "ಪ್ರದೇಶ (ಐಚ್ಛಿಕ)",
+        "all_regions": "ಎಲ್ಲಾ ಪ್ರದೇಶಗಳು",
+        "nutrient": "ಪೋಷಕಾಂಶ",
+        "total_samples": "ಸಂಗ್ರಹಿಸಿದ ಮಾದರಿಗಳು",
+        "mean_deficit_by_soil": "ಪ್ರತಿ ತಿಂಗಳು ಮಣ್ಣಿನ ಪ್ರಕಾರದ ಸರಾಸರಿ ಕೊರತೆ",
+        "deficient_share_by_crop": "ಪ್ರತಿ ಬೆಳೆಗೆ ಕೊರತೆಯಿರುವ ಮಾದರಿಗಳ ಪಾಲು",
+        "no_archive_data": "ಇನ್ನೂ ಯಾವುದೇ ಮಾದರಿಗಳನ್ನು ಸಂಗ್ರಹಿಸಲಾಗಿಲ್ಲ.",
+        "season_report": "ಋತು ವರದಿ",
+        "start_date": "ಇಂದ",
+        "end_date": "ವರೆಗೆ",
+        "report_format": "ಸ್ವರೂಪ",
+        "all_users": "ಎಲ್ಲಾ ಬಳಕೆದಾರರು",
+        "generate_report": "ವರದಿ ರಚಿಸಿ",
+        "report_pending": "ವರದಿ ರಚಿಸಲಾಗುತ್ತಿದೆ…",
+        "report_failed": "ವರದಿ ವಿಫಲವಾಗಿದೆ",
+        "report_busy": "ಹಲವಾರು ವರದಿಗಳು ರಚನೆಯಾಗುತ್ತಿವೆ. ದಯವಿಟ್ಟು ಸ್ವಲ್ಪ ಸಮಯದ ನಂತರ ಮತ್ತೆ ಪ್ರಯತ್ನಿಸಿ.",
+        "logout": "ಲಾಗ್ ಔಟ್",
+        "login_busy": "ಈಗ ಹೆಚ್ಚು ಲಾಗಿನ್‌ಗಳು ನಡೆಯುತ್ತಿವೆ; ದಯವಿಟ್ಟು ಸ್ವಲ್ಪ ಸಮಯದ ನಂತರ ಮತ್ತೆ ಪ್ರಯತ್ನಿಸಿ.",
+        "single_product_alternatives": "ಏಕ-ಉತ್ಪನ್ನ ಪರ್ಯಾಯಗಳು",
+        "alternatives_note": "ಪ್ರತಿ ಸಾಲು ಒಂದೇ ಉತ್ಪನ್ನದಿಂದ ಒಂದು ಪೋಷಕಾಂಶವನ್ನು ಪೂರೈಸುತ್ತದೆ. ಮಿಶ್ರಣದ ಬದಲು ಪ್ರತಿ ಪೋಷಕಾಂಶಕ್ಕೆ ಒಂದು ಸಾಲನ್ನು ಬಳಸಿ; ಪ್ರಮಾಣಗಳನ್ನು ಸೇರಿಸಬಾರದು.",
+    },
+}
@@ -0,0 +1,231 @@
+# loadtest.py
+"""Concurrent-session load generator for app.py.
+
+    python loadtest.py --sessions 50 --iterations 20
+
+Every simulated session drives the real script headlessly through
+Streamlit's AppTest. It registers a fresh user, logs in, then repeatedly
+picks a soil and crop, enters N/P/K, analyzes and resets. Each step's
+latency is recorded, SQLite lock errors are counted and session_state
+size is tracked per session.
+
+AppTest swaps a process-global Runtime in and out around every run, so
+concurrent sessions cannot share a process. Each session therefore runs
+in its own process, all released together by a barrier, against one
+throwaway SQLite database on this machine. Process-wide caches (pool,
+catalog) are per session here, which makes the DB contention figures a
+pessimistic bound for one Streamlit server process.
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+
+import db_setup
+
+LOCK_MARKERS = ("database is locked", "database table is locked", "busy")
+
+
+def session_state_bytes(at):
+    """Approximate size of a session's state, by pickling each value"""
+    total = 0
+    for value in at.session_state.to_dict().values():
+        try:
+            total += len(pickle.dumps(value))
+        except Exception:
+            total += sys.getsizeof(value)
+    return total
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.lock_errors = defaultdict(int)
+        self.failures = defaultdict(int)
+        self.first_failure = {}
+        self.memory = []
+
+    def step(self, name, at, action):
+        start = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            self.failures[name] += 1
+            self.first_failure.setdefault(name, f"{type(e).__name__}: {e}")
+            if any(marker in str(e) for marker in LOCK_MARKERS):
+                self.lock_errors[name] += 1
+            return False
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        messages = [e.value for e in at.error] + [e.value for e in at.sidebar.error]
+        messages += [e.message for e in at.exception]
+        for message in messages:
+            if any(marker in str(message) for marker in LOCK_MARKERS):
+                self.lock_errors[name] += 1
+        return True
+
+    def snapshot(self):
+        # AppTest rebinds __main__ while a script runs, so a Recorder instance
+        # no longer pickles by reference; ship plain containers instead
+        return {
+            "latencies": dict(self.latencies),
+            "lock_errors": dict(self.lock_errors),
+            "failures": dict(self.failures),
+            "first_failure": self.first_failure,
+            "memory": self.memory,
+        }
+
+    def merge(self, snapshot):
+        for name, times in snapshot["latencies"].items():
+            self.latencies[name].extend(times)
+        for name, count in snapshot["lock_errors"].items():
+            self.lock_errors[name] += count
+        for name, count in snapshot["failures"].items():
+            self.failures[name] += count
+        for name, message in snapshot["first_failure"].items():
+            self.first_failure.setdefault(name, message)
+        self.memory.extend(snapshot["memory"])
+
+
+def run_session(app_path, index, iterations, recorder, seed):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + index)
+    username = f"load-{seed}-{index}"
+    password = "load-password"
+    at = AppTest.from_file(app_path, default_timeout=120)
+
+    recorder.step("initial load", at, at.run)
+
+    def register():
+        at.sidebar.selectbox[1].select("Register").run()
+        at.sidebar.text_input[0].input(username)
+        at.sidebar.text_input[1].input(password)
+        at.sidebar.button[0].click().run()
+
+    def login():
+        at.sidebar.selectbox[1].select("Login").run()
+        at.sidebar.text_input[0].input(username)
+        at.sidebar.text_input[1].input(password)
+        at.sidebar.button[0].click().run()
+
+    recorder.step("register_user", at, register)
+    recorder.step("verify_user", at, login)
+    if not at.session_state["logged_in"]:
+        recorder.failures["login"] += 1
+        return
+    start_bytes = session_state_bytes(at)
+    peak_bytes = start_bytes
+
+    for _ in range(iterations):
+        soil = at.main.selectbox[0]
+        recorder.step("select soil", at, lambda: soil.select_index(rng.randrange(len(soil.options))).run())
+        crop = at.main.selectbox[1]
+        recorder.step("select crop", at, lambda: crop.select_index(rng.randrange(len(crop.options))).run())
+
+        def set_levels():
+            for widget in at.main.number_input[:3]:
+                widget.set_value(rng.randrange(0, 150))
+            at.run()
+
+        recorder.step("nutrient input", at, set_levels)
+        recorder.step("analyze", at, lambda: at.main.button[0].click().run())
+        peak_bytes = max(peak_bytes, session_state_bytes(at))
+        recorder.step("reset", at, lambda: at.main.button[1].click().run())
+
+    recorder.memory.append((start_bytes, peak_bytes, session_state_bytes(at)))
+
+
+def session_process(app_path, workdir, index, iterations, seed, barrier, results):
+    # app.py opens soil_recommendation.db relative to the working directory
+    os.chdir(workdir)
+    recorder = Recorder()
+    try:
+        barrier.wait()
+        run_session(app_path, index, iterations, recorder, seed)
+    except Exception:
+        recorder.failures["session"] += 1
+        recorder.first_failure.setdefault("session", traceback.format_exc())
+    results.put(recorder.snapshot())
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def report(recorder, sessions, elapsed):
+    print(f"{sessions} sessions finished in {elapsed:.1f}s")
+    print(f"{'step':16} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'locks':>6} {'fails':>6}")
+    steps = list(recorder.latencies) + [s for s in recorder.failures if s not in recorder.latencies]
+    for step in steps:
+        times = sorted(recorder.latencies.get(step, [])) or [float("nan")]
+        print(f"{step:16} {len(recorder.latencies.get(step, [])):>7} {percentile(times, 50):>9.1f} "
+              f"{percentile(times, 90):>9.1f} {percentile(times, 99):>9.1f} {times[-1]:>9.1f} "
+              f"{recorder.lock_errors.get(step, 0):>6} {recorder.failures.get(step, 0):>6}")
+    for step, message in recorder.first_failure.items():
+        print(f"first {step} failure: {message}")
+    if recorder.memory:
+        print(f"session_state bytes per session: "
+              f"after login mean {statistics.fmean(m[0] for m in recorder.memory):,.0f}, "
+              f"peak mean {statistics.fmean(m[1] for m in recorder.memory):,.0f}, "
+              f"end mean {statistics.fmean(m[2] for m in recorder.memory):,.0f}, "
+              f"max growth {max(m[2] - m[0] for m in recorder.memory):,}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent app.py sessions")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions")
+    parser.add_argument("--iterations", type=int, default=10, help="analyze/reset cycles per session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-db", action="store_true", help="leave the temporary database in place")
+    args = parser.parse_args(argv)
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    workdir = tempfile.mkdtemp(prefix="soil-load-")
+    recorder = Recorder()
+    try:
+        db_setup.ensure_db(os.path.join(workdir, db_setup.DB_PATH))
+        barrier = multiprocessing.Barrier(args.sessions)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=session_process,
+                args=(app_path, workdir, index, args.iterations, args.seed, barrier, results),
+                name=f"session-{index}",
+            )
+            for index in range(args.sessions)
+        ]
+        for process in processes:
+            process.start()
+        # The barrier releases every session once all have started
+        started = time.perf_counter()
+        for _ in processes:
+            while True:
+                try:
+                    recorder.merge(results.get(timeout=5))
+                    break
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise RuntimeError("A session process exited without reporting results")
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        report(recorder, args.sessions, elapsed)
+    finally:
+        if args.keep_db:
+            print(f"Database kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if recorder.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# metrics.py
+"""In-process timing spans, counters and Prometheus text exposition.
+
+Enabled by setting SOIL_METRICS=1 before start. When it is off, timed()
+returns the function it wraps unchanged, span() returns one shared
+no-op context and counters return immediately, so instrumented code
+runs exactly as it would without instrumentation.
+
+    with metrics.span("db.fetch_history"):
+        ...
+
+    @metrics.timed("engine.evaluate")
+    def evaluate(...):
+        ...
+
+SQLite statements are counted through a trace callback installed by
+instrument_connection(), both process-wide and per thread, which is how
+a Streamlit rerun (one script thread) gets its own query count.
+"""
+import functools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("SOIL_METRICS", "").lower() in ("1", "true", "yes", "on")
+METRICS_FILE = os.environ.get("SOIL_METRICS_FILE")
+
+# Seconds; spans in this app range from microseconds (cache hits) to seconds (bulk files)
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th observation"""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Registry:
+    """Thread-safe store of span histograms, counters and gauge collectors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._reruns = Histogram(TIME_BUCKETS)
+        self._rerun_queries = Histogram(QUERY_BUCKETS)
+        self._counters = {}
+        self._collectors = {}
+        self._local = threading.local()
+        self.started_at = time.time()
+
+    def observe_span(self, name, seconds):
+        with self._lock:
+            histogram = self._spans.get(name)
+            if histogram is None:
+                histogram = self._spans[name] = Histogram(TIME_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_rerun(self, seconds, queries):
+        with self._lock:
+            self._reruns.observe(seconds)
+            self._rerun_queries.observe(queries)
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(sorted(dict(labels).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def count_query(self):
+        self._local.queries = getattr(self._local, "queries", 0) + 1
+        self.inc("sqlite_queries_total")
+
+    def thread_queries(self):
+        return getattr(self._local, "queries", 0)
+
+    def register_collector(self, name, collect):
+        """collect() returns {metric_name: value} gauges, read at exposition time"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def snapshot(self):
+        with self._lock:
+            spans = {
+                name: {
+                    "count": h.count,
+                    "total_ms": h.sum * 1000,
+                    "mean_ms": h.sum / h.count * 1000 if h.count else math.nan,
+                    "p90_ms": h.quantile(0.9) * 1000,
+                    "max_ms": h.max * 1000,
+                }
+                for name, h in sorted(self._spans.items())
+            }
+            reruns = {
+                "count": self._reruns.count,
+                "mean_ms": self._reruns.sum / self._reruns.count * 1000 if self._reruns.count else math.nan,
+                "p90_ms": self._reruns.quantile(0.9) * 1000,
+                "max_ms": self._reruns.max * 1000,
+                "mean_queries": (self._rerun_queries.sum / self._rerun_queries.count
+                                 if self._rerun_queries.count else math.nan),
+                "max_queries": self._rerun_queries.max,
+            }
+            counters = dict(self._counters)
+            collectors = list(self._collectors.items())
+        gauges = {}
+        for name, collect in collectors:
+            try:
+                gauges.update(collect())
+            except Exception:
+                self.inc("metrics_collector_errors_total", {"collector": name})
+        return {"spans": spans, "reruns": reruns, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self):
+        """Current values in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = [("soil_span_seconds", {"span": name}, h) for name, h in sorted(self._spans.items())]
+            if self._reruns.count:
+                histograms.append(("soil_rerun_seconds", {}, self._reruns))
+                histograms.append(("soil_rerun_queries", {}, self._rerun_queries))
+            histograms = [(name, labels, _copy(h)) for name, labels, h in histograms]
+            counters = sorted(self._counters.items())
+        gauges = self.snapshot()["gauges"]
+
+        lines = []
+        declared = set()
+        for name, labels, h in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {h.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(h.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        for (name, labels), value in counters:
+            metric = f"soil_{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{_labels(dict(labels))} {_number(value)}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE soil_{name} gauge")
+            lines.append(f"soil_{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically replace path with the current exposition, for node_exporter's textfile collector"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._reruns = Histogram(TIME_BUCKETS)
+            self._rerun_queries = Histogram(QUERY_BUCKETS)
+            self._counters.clear()
+
+
+def _copy(h):
+    copy = Histogram(h.buckets)
+    copy.counts = list(h.counts)
+    copy.count, copy.sum, copy.max = h.count, h.sum, h.max
+    return copy
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+registry = Registry()
+
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe_span(name, time.perf_counter() - start)
+
+
+def span(name):
+    """Time a block under name"""
+    if not ENABLED:
+        return _NOOP
+    return _span(name)
+
+
+def timed(name):
+    """Decorator form of span(); a no-op that returns fn itself when disabled"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe_span(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+_last_write = [0.0]
+_write_lock = threading.Lock()
+
+
+def _write_file_throttled(min_interval=5.0):
+    now = time.monotonic()
+    if now - _last_write[0] < min_interval or not _write_lock.acquire(blocking=False):
+        return
+    try:
+        _last_write[0] = now
+        registry.write_textfile(METRICS_FILE)
+    except OSError:
+        registry.inc("metrics_file_errors_total")
+    finally:
+        _write_lock.release()
+
+
+def start_rerun():
+    """Token for finish_rerun(); None when disabled"""
+    if not ENABLED:
+        return None
+    return time.perf_counter(), registry.thread_queries()
+
+
+def finish_rerun(started):
+    """Record one script run's wall time and the queries its thread made"""
+    if started is None:
+        return
+    start, queries = started
+    registry.observe_rerun(time.perf_counter() - start, registry.thread_queries() - queries)
+    if METRICS_FILE:
+        _write_file_throttled()
+
+
+def inc(name, labels=(), amount=1):
+    if ENABLED:
+        registry.inc(name, labels, amount)
+
+
+def register_collector(name, collect):
+    if ENABLED:
+        registry.register_collector(name, collect)
+
+
+def _trace(statement):
+    registry.count_query()
+
+
+def instrument_connection(conn):
+    """Count every statement run on conn; does nothing when disabled"""
+    if ENABLED:
+        conn.set_trace_callback(_trace)
+    return conn
@@ -0,0 +1,413 @@
+# reports.py
+"""Report rendering, a disk cache of finished files and a background job queue.
+
+Every report is streamed straight into its output file, one sample at a
+time, so a season of analyses never has to fit in memory. Files are
+cached under a hash of what they contain (report kind, format, language
+and the data they were built from), so asking for the same report again
+just returns the cached file. Large reports run on a small thread pool
+and are tracked by job id, so the page that requested them stays
+responsive.
+"""
+import csv
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import engine
+import metrics
+from catalog import FERTILIZER_PRICES, NUTRIENTS
+
+REPORT_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get("SOIL_REPORT_DIR", "report_cache")
+MIME_TYPES = {"txt": "text/plain", "csv": "text/csv", "pdf": "application/pdf"}
+BLEND_PRODUCTS = list(FERTILIZER_PRICES)
+
+
+class ReportError(Exception):
+    pass
+
+
+class ReportQueueFull(ReportError):
+    pass
+
+
+def available_formats():
+    formats = ["txt", "csv"]
+    if importlib.util.find_spec("reportlab") is not None:
+        formats.append("pdf")
+    return formats
+
+
+def content_key(kind, fmt, payload):
+    data = json.dumps([REPORT_VERSION, kind, fmt, payload], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+# Disk cache
+class ReportCache:
+    """Finished report files named by content key, evicted oldest-first past max_bytes"""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def path(self, key, fmt):
+        return os.path.join(self.root, f"{key}.{fmt}")
+
+    def get(self, key, fmt):
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, fmt, render):
+        """Run render(file) into a temp file and move it into place"""
+        path = self.path(key, fmt)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if fmt == "pdf":
+                render(tmp)
+            else:
+                with open(tmp, "w", newline="", encoding="utf-8") as f:
+                    render(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def get_or_render(self, key, fmt, render):
+        return self.get(key, fmt) or self.put(key, fmt, render)
+
+    def read(self, key, fmt, render, attempts=3):
+        """Contents of the report, rendered again if eviction removed it.
+
+        Paths are never handed out for later use: eviction may delete the
+        file at any time, but once it is open here the read cannot fail.
+        """
+        for _ in range(attempts):
+            try:
+                with open(self.get_or_render(key, fmt, render), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                metrics.inc("report_evicted_reads_total")
+        raise ReportError("The report was evicted from the cache while it was being read")
+
+    def evict(self, keep=None):
+        """Remove the least recently used files past max_bytes; keep is never removed"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.root):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+# Writers
+def write_text(out, result, lang, now=None, title=None):
+    """Plain-text report for one structured recommend() result"""
+    if title:
+        out.write(f"{title}\n")
+    engine.write_results(
+        out,
+        engine.format_analysis(result["balance"], lang),
+        engine.format_amounts(result["inorganic"]),
+        engine.format_amounts(result["organic"]),
+        result.get("blend"),
+        now,
+    )
+
+
+CSV_COLUMNS = (
+    ["date", "soil", "crop"]
+    + list(NUTRIENTS)
+    + [f"{nutrient}_standard" for nutrient in NUTRIENTS]
+    + [f"{nutrient}_balance" for nutrient in NUTRIENTS]
+    + [f"blend_{product.lower()}_kg" for product in BLEND_PRODUCTS]
+    + ["blend_cost"]
+)
+
+
+def csv_row(row, ref):
+    result = row["result"]
+    crop = ref.crops.get(row["crop_id"])
+    blend = result.get("blend") or {"items": [], "cost": None}
+    kg = {item["product"]: item["kg"] for item in blend["items"]}
+    return (
+        [row["created_at"][:19], ref.soil_names.get(row["soil_id"], row["soil_id"]),
+         crop["crop_name"] if crop else row["crop_id"]]
+        + [row[nutrient] for nutrient in NUTRIENTS]
+        + [result["standard"][nutrient] for nutrient in NUTRIENTS]
+        + [f"{result['balance'][nutrient]:.2f}" for nutrient in NUTRIENTS]
+        + [f"{kg.get(product, 0):.2f}" for product in BLEND_PRODUCTS]
+        + ["" if blend["cost"] is None else f"{blend['cost']:.2f}"]
+    )
+
+
+def write_csv(out, rows, ref):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        writer.writerow(csv_row(row, ref))
+
+
+def write_season_text(out, rows, ref, lang):
+    count = 0
+    for row in rows:
+        crop = ref.crops.get(row["crop_id"])
+        title = (f"#{count + 1} {ref.soil_names.get(row['soil_id'], row['soil_id'])} / "
+                 f"{crop['crop_name'] if crop else row['crop_id']}")
+        if count:
+            out.write("\n" + "=" * 60 + "\n")
+        write_text(out, row["result"], lang, datetime.fromisoformat(row["created_at"]), title)
+        count += 1
+    if not count:
+        out.write("No analyses in this period.\n")
+
+
+class PdfLines:
+    """File-like sink that lays out written text as PDF lines, page by page"""
+
+    def __init__(self, path):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(path, pagesize=A4)
+        self.width, self.height = A4
+        self.margin = 50
+        self.y = self.height - self.margin
+        self.pending = ""
+
+    def write(self, text):
+        self.pending += text
+        *lines, self.pending = self.pending.split("\n")
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line):
+        if self.y < self.margin:
+            self.canvas.showPage()
+            self.y = self.height - self.margin
+        self.canvas.setFont("Helvetica", 10)
+        # Helvetica has no rupee glyph
+        self.canvas.drawString(self.margin, self.y, line.replace("₹", "Rs "))
+        self.y -= 14
+
+    def close(self):
+        if self.pending:
+            self._line(self.pending)
+        self.canvas.save()
+
+
+def text_renderer(fmt, write):
+    """Adapt a text writer write(out) to ReportCache.put for txt or pdf"""
+    if fmt != "pdf":
+        return write
+
+    def render(path):
+        sink = PdfLines(path)
+        write(sink)
+        sink.close()
+    return render
+
+
+# Single sample and season reports
+def sample_report(row, ref, fmt, lang_name, lang):
+    """(key, render) for one saved analysis row"""
+    key = content_key("sample", fmt, {"row": row, "lang": lang_name, "catalog": ref.version})
+    if fmt == "csv":
+        return key, lambda out: write_csv(out, [row], ref)
+    now = datetime.fromisoformat(row["created_at"])
+    return key, text_renderer(fmt, lambda out: write_text(out, row["result"], lang, now))
+
+
+def iter_analyses(pool, user_id=None, start=None, end=None, page_size=1000):
+    """Analyses oldest first, one keyset page at a time; start/end are ISO dates, end exclusive"""
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if start:
+        where.append("created_at >= ?")
+        params.append(start)
+    if end:
+        where.append("created_at < ?")
+        params.append(end)
+    after = None
+    while True:
+        clauses = list(where)
+        page_params = list(params)
+        if after is not None:
+            clauses.append("(created_at, id) > (?, ?)")
+            page_params += list(after)
+        sql = (
+            "SELECT id, soil_id, crop_id, nitrogen, phosphorus, potassium, result, created_at FROM analyses"
+            + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            + " ORDER BY created_at, id LIMIT ?"
+        )
+        with pool.read() as conn:
+            fetched = conn.execute(sql, page_params + [page_size]).fetchall()
+        for row in fetched:
+            yield {
+                "id": row[0],
+                "soil_id": row[1],
+                "crop_id": row[2],
+                "nitrogen": row[3],
+                "phosphorus": row[4],
+                "potassium": row[5],
+                "result": json.loads(row[6]),
+                "created_at": row[7],
+            }
+        if len(fetched) < page_size:
+            return
+        after = (fetched[-1][7], fetched[-1][0])
+
+
+def season_fingerprint(pool, user_id=None, start=None, end=None):
+    """Row count and newest id in the range; changes whenever the report would"""
+    sql = "SELECT COUNT(*), MAX(id) FROM analyses WHERE 1 = 1"
+    params = []
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(user_id)
+    if start:
+        sql += " AND created_at >= ?"
+        params.append(start)
+    if end:
+        sql += " AND created_at < ?"
+        params.append(end)
+    with pool.read() as conn:
+        return list(conn.execute(sql, params).fetchone())
+
+
+def season_report(pool, ref, fmt, lang_name, lang, user_id=None, start=None, end=None):
+    """(key, render) for every analysis in a date range, for one user or all"""
+    payload = {
+        "user_id": user_id, "start": start, "end": end, "lang": lang_name,
+        "catalog": ref.version, "data": season_fingerprint(pool, user_id, start, end),
+    }
+    key = content_key("season", fmt, payload)
+
+    def rows():
+        return iter_analyses(pool, user_id, start, end)
+
+    if fmt == "csv":
+        return key, lambda out: write_csv(out, rows(), ref)
+    return key, text_renderer(fmt, lambda out: write_season_text(out, rows(), ref, lang))
+
+
+# Background jobs
+class ReportQueue:
+    """Bounded pool of report workers; jobs are tracked by id.
+
+    submit() returns at once. A report that is already cached finishes
+    immediately, a report already being built is shared, and more than
+    max_pending unfinished jobs raise ReportQueueFull. Finished reports
+    are fetched with read(), which renders them again if the cache has
+    evicted the file since.
+    """
+
+    def __init__(self, cache, max_workers=2, max_pending=16, keep_jobs=256):
+        self.cache = cache
+        self.max_pending = max_pending
+        self.keep_jobs = keep_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+        self._renders = {}  # job id -> render, kept to rebuild evicted reports
+
+    def submit(self, key, fmt, render, name="report"):
+        with self._lock:
+            previous = self._jobs.get(self._by_key.get((key, fmt)))
+            if previous and previous["state"] in ("queued", "running"):
+                return previous["id"]
+            job = {
+                "id": uuid.uuid4().hex,
+                "key": key,
+                "name": name,
+                "format": fmt,
+                "state": "queued",
+                "error": None,
+                "submitted_at": time.time(),
+                "finished_at": None,
+            }
+            if self.cache.get(key, fmt):
+                job.update(state="done", finished_at=job["submitted_at"])
+                metrics.inc("report_cache_hits_total")
+            else:
+                pending = sum(1 for j in self._jobs.values() if j["state"] in ("queued", "running"))
+                if pending >= self.max_pending:
+                    raise ReportQueueFull("Too many reports are being generated; try again shortly")
+            self._jobs[job["id"]] = job
+            self._by_key[(key, fmt)] = job["id"]
+            self._renders[job["id"]] = render
+            self._prune()
+        if job["state"] == "queued":
+            self._executor.submit(self._run, job, key, fmt, render)
+        return job["id"]
+
+    def _run(self, job, key, fmt, render):
+        with self._lock:
+            job["state"] = "running"
+        try:
+            with metrics.span(f"reports.{fmt}"):
+                self.cache.put(key, fmt, render)
+            update = {"state": "done"}
+        except Exception as e:
+            update = {"state": "failed", "error": f"{type(e).__name__}: {e}"}
+            metrics.inc("report_failures_total")
+        with self._lock:
+            job.update(update, finished_at=time.time())
+
+    def _prune(self):
+        finished = sorted(
+            (j for j in self._jobs.values() if j["finished_at"] is not None),
+            key=lambda j: j["finished_at"],
+        )
+        for job in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+            del self._jobs[job["id"]]
+            del self._renders[job["id"]]
+            if self._by_key.get((job["key"], job["format"])) == job["id"]:
+                del self._by_key[(job["key"], job["format"])]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def read(self, job_id):
+        """Contents of a finished job's report"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["state"] != "done":
+                raise ReportError("This report is no longer available; generate it again")
+            key, fmt, render = job["key"], job["format"], self._renders[job_id]
+        return self.cache.read(key, fmt, render)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
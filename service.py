@@ -0,0 +1,265 @@
+# service.py
+"""HTTP recommendation service built on engine.py.
+
+Each worker process opens one ConnectionPool and one CatalogCache at
+startup and reuses them for every request. With SOIL_METRICS=1,
+/metrics serves that worker's spans and counters as Prometheus text.
+Run with:
+
+    python service.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+import argparse
+import json
+import math
+import numbers
+from contextlib import asynccontextmanager
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import batch_analysis
+import catalog
+import db_pool
+import db_setup
+import engine
+import metrics
+from catalog import NUTRIENTS
+
+MAX_BATCH_SIZE = 10_000
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def error(status, message):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def parse_sample(item):
+    if not isinstance(item, dict):
+        raise BadRequest("Each sample must be a JSON object")
+    crop_id = item.get("crop_id")
+    # Bounded so batches fit the int64 crop id array
+    if not isinstance(crop_id, int) or isinstance(crop_id, bool) or not INT64_MIN <= crop_id <= INT64_MAX:
+        raise BadRequest("crop_id must be a 64-bit integer")
+    levels = []
+    for nutrient in NUTRIENTS:
+        value = item.get(nutrient)
+        if not isinstance(value, numbers.Real) or isinstance(value, bool):
+            raise BadRequest(f"{nutrient} must be a non-negative number")
+        try:
+            finite = math.isfinite(float(value))
+        except OverflowError:
+            finite = False
+        if not finite or value < 0:
+            raise BadRequest(f"{nutrient} must be a non-negative number")
+        levels.append(value)
+    return crop_id, levels
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise BadRequest("Request body must be valid JSON")
+
+
+def get_catalog(request):
+    return request.app.state.catalog_cache.get()
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "ok",
+        "catalog_version": get_catalog(request).version,
+        "cache": request.app.state.cache.stats(),
+    })
+
+
+async def prometheus_metrics(request):
+    if not metrics.ENABLED:
+        return error(404, "Metrics are disabled; set SOIL_METRICS=1")
+    return PlainTextResponse(
+        metrics.registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+async def list_soils(request):
+    return JSONResponse(get_catalog(request).soils)
+
+
+async def list_crops(request):
+    ref = get_catalog(request)
+    soil_id = request.path_params["soil_id"]
+    if soil_id not in ref.soil_names:
+        return error(404, "Unknown soil_id")
+    return JSONResponse([
+        {"id": crop["id"], "crop_name": crop["crop_name"]}
+        for crop in ref.crops_by_soil.get(soil_id, [])
+    ])
+
+
+async def recommend(request):
+    try:
+        crop_id, (n, p, k) = parse_sample(await read_json(request))
+    except BadRequest as e:
+        return error(400, str(e))
+    result = engine.recommend(get_catalog(request), crop_id, n, p, k, cache=request.app.state.cache)
+    if result is None:
+        return error(404, "No standard nutrient data found for this crop")
+    return JSONResponse({"crop_id": crop_id, **result})
+
+
+def batch_response(results):
+    """Turn an analyze_batch frame back into per-sample JSON results.
+
+    Built a column at a time: NaN masks and float conversion happen in
+    NumPy, and the per-row work is only list appends and dict assembly.
+    """
+    count = len(results)
+    inorganic = [[] for _ in range(count)]
+    organic = [[] for _ in range(count)]
+    for i, product in enumerate(batch_analysis.PRODUCT_NAMES):
+        target = organic if batch_analysis.ORGANIC_MASK[i] else inorganic
+        for nutrient in NUTRIENTS:
+            name = batch_analysis.amount_column(product, nutrient)
+            if name not in results.columns:
+                continue
+            kg = results[name].to_numpy(dtype=np.float64)
+            rows = np.flatnonzero(~np.isnan(kg))
+            for row, value in zip(rows.tolist(), kg[rows].tolist()):
+                target[row].append({"product": product, "nutrient": nutrient, "kg": value})
+
+    blends = batch_blends(results)
+    crop_ids = results["crop_id"].to_numpy().tolist()
+    has_standard = results["has_standard"].to_numpy().tolist()
+    standards = [results[f"{n}_standard"].to_numpy(dtype=np.float64).tolist() for n in NUTRIENTS]
+    balances = [results[f"{n}_balance"].to_numpy(dtype=np.float64).tolist() for n in NUTRIENTS]
+    items = []
+    for row in range(count):
+        if not has_standard[row]:
+            items.append({"crop_id": int(crop_ids[row]), "error": "No standard nutrient data found for this crop"})
+            continue
+        items.append({
+            "crop_id": int(crop_ids[row]),
+            "standard": {n: standards[j][row] for j, n in enumerate(NUTRIENTS)},
+            "balance": {n: balances[j][row] for j, n in enumerate(NUTRIENTS)},
+            "inorganic": inorganic[row],
+            "organic": organic[row],
+            "blend": blends[row],
+        })
+    return items
+
+
+def batch_blends(results):
+    """Blend dict (or None where infeasible) per row of an analyze_batch frame"""
+    cost = results["blend_cost"].to_numpy(dtype=np.float64)
+    items = [[] for _ in range(len(cost))]
+    for product in batch_analysis.PRODUCT_NAMES:
+        kg = results[batch_analysis.blend_column(product)].to_numpy(dtype=np.float64)
+        price = catalog.FERTILIZER_PRICES[product]
+        rows = np.flatnonzero(kg > 1e-9)
+        for row, value in zip(rows.tolist(), kg[rows].tolist()):
+            items[row].append({"product": product, "kg": value, "cost": value * price})
+    return [
+        None if math.isnan(total) else {"items": row_items, "cost": total}
+        for row_items, total in zip(items, cost.tolist())
+    ]
+
+
+def encode_results(items, chunk_size=200):
+    """{"results": items} as JSON bytes, encoded a chunk at a time.
+
+    One json.dumps over 10k results holds the GIL for a quarter of a
+    second; chunks let the event loop thread run in between.
+    """
+    chunks = [
+        json.dumps(items[start:start + chunk_size], separators=(",", ":"), allow_nan=False)[1:-1]
+        for start in range(0, len(items), chunk_size)
+    ]
+    return ('{"results":[' + ",".join(chunks) + "]}").encode()
+
+
+def batch_recommendations(ref, body):
+    """Parse, analyze and render a batch request; CPU-bound, so run off the event loop"""
+    try:
+        try:
+            body = json.loads(body)
+        except ValueError:
+            raise BadRequest("Request body must be valid JSON")
+        samples = body.get("samples") if isinstance(body, dict) else None
+        if not isinstance(samples, list):
+            raise BadRequest("Body must be an object with a samples list")
+        if len(samples) > MAX_BATCH_SIZE:
+            raise BadRequest(f"At most {MAX_BATCH_SIZE} samples per request")
+        parsed = [parse_sample(item) for item in samples]
+    except BadRequest as e:
+        return error(400, str(e))
+    if not parsed:
+        return JSONResponse({"results": []})
+
+    crop_ids = np.array([crop_id for crop_id, _ in parsed], dtype=np.int64)
+    levels = np.array([sample_levels for _, sample_levels in parsed], dtype=np.float64)
+    results = batch_analysis.analyze_batch(ref, crop_ids, levels[:, 0], levels[:, 1], levels[:, 2])
+    return Response(encode_results(batch_response(results)), media_type="application/json")
+
+
+async def recommend_batch(request):
+    body = await request.body()
+    return await run_in_threadpool(batch_recommendations, get_catalog(request), body)
+
+
+def create_app(db_path=db_setup.DB_PATH):
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.pool = db_pool.ConnectionPool(db_path)
+        app.state.catalog_cache = catalog.CatalogCache(app.state.pool)
+        app.state.cache = engine.RecommendationCache()
+        pool, cache = app.state.pool, app.state.cache
+        metrics.register_collector("pool", lambda: {f"pool_{key}": value for key, value in pool.stats().items()})
+        metrics.register_collector(
+            "recommendation_cache", lambda: {f"recommendation_cache_{key}": value for key, value in cache.stats().items()}
+        )
+        try:
+            yield
+        finally:
+            app.state.pool.close()
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/metrics", prometheus_metrics),
+            Route("/soils", list_soils),
+            Route("/soils/{soil_id:int}/crops", list_crops),
+            Route("/recommend", recommend, methods=["POST"]),
+            Route("/recommend/batch", recommend_batch, methods=["POST"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the soil recommendation HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    # Migrate once up front so worker processes start against a ready schema
+    db_setup.ensure_db()
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# test_auth.py
+"""Password hashing, login, rehashing and session tokens.
+
+    python -m pytest -q test_auth.py
+"""
+import hashlib
+
+import pytest
+
+import auth
+import db_pool
+
+# Cheap KDF parameters; the schemes and code paths are the same as in production
+FAST_HASHERS = [auth.ScryptHasher(n=2 ** 10), auth.Pbkdf2Hasher(iterations=1000)]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db_pool.ConnectionPool(str(tmp_path / "auth.db"))
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def service(pool):
+    service = auth.AuthService(pool, hasher=FAST_HASHERS[0], wait_timeout=0.1,
+                               tokens=auth.SessionTokens(secret="test"))
+    yield service
+    service.close()
+
+
+def stored_password(pool, username):
+    with pool.read() as conn:
+        return conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def set_password(pool, username, encoded):
+    pool.execute_write("UPDATE users SET password = ? WHERE username = ?", (encoded, username))
+
+
+# Hashers
+@pytest.mark.parametrize("hasher", FAST_HASHERS, ids=lambda h: h.scheme)
+def test_hasher_round_trip(hasher):
+    encoded = hasher.encode("s3cret")
+    assert encoded.startswith(hasher.scheme + "$")
+    assert hasher.verify("s3cret", encoded)
+    assert not hasher.verify("wrong", encoded)
+    assert hasher.is_current(encoded)
+    assert auth.hasher_for(encoded, hasher).scheme == hasher.scheme
+    # Salted: the same password never encodes the same way twice
+    assert hasher.encode("s3cret") != encoded
+
+
+def test_changed_parameters_are_not_current():
+    old = auth.ScryptHasher(n=2 ** 10).encode("s3cret")
+    assert not auth.ScryptHasher(n=2 ** 11).is_current(old)
+    assert auth.ScryptHasher(n=2 ** 11).verify("s3cret", old)
+    assert not FAST_HASHERS[1].is_current(old)
+
+
+@pytest.mark.parametrize("encoded", [
+    "scrypt$x$8$1$c2FsdA$aGFzaA",
+    "scrypt$1024$8$1$only-five-fields",
+    "pbkdf2_sha256$1000$!!!$???",
+    "pbkdf2_sha256$-5$c2FsdA$aGFzaA",
+])
+def test_malformed_hash_fails_verification(encoded):
+    hasher = auth.hasher_for(encoded, FAST_HASHERS[0])
+    assert hasher is not None and not hasher.verify("s3cret", encoded)
+
+
+def test_unknown_format_has_no_hasher():
+    assert auth.hasher_for("md5$abc", FAST_HASHERS[0]) is None
+    assert auth.hasher_for("not a hash", FAST_HASHERS[0]) is None
+
+
+# Accounts
+def test_register_and_login(service):
+    assert service.register_user("asha", "s3cret")
+    user = service.authenticate("asha", "s3cret")
+    assert user is not None and user[1] == "asha"
+    token = service.login("asha", "s3cret")
+    assert service.current_user(token) == user
+
+
+def test_duplicate_registration_returns_false(service):
+    assert service.register_user("asha", "s3cret")
+    assert not service.register_user("asha", "other")
+    assert service.authenticate("asha", "s3cret")
+
+
+@pytest.mark.parametrize("username, password", [("asha", "wrong"), ("nobody", "s3cret"), ("asha", "")])
+def test_bad_credentials_fail(service, username, password):
+    service.register_user("asha", "s3cret")
+    assert service.authenticate(username, password) is None
+    assert service.login(username, password) is None
+
+
+@pytest.mark.parametrize("encoded", ["scrypt$garbage", "pbkdf2_sha256$1$$", "not a hash", ""])
+def test_malformed_stored_hash_fails_login(service, pool, encoded):
+    service.register_user("asha", "s3cret")
+    set_password(pool, "asha", encoded)
+    assert service.authenticate("asha", "s3cret") is None
+    assert stored_password(pool, "asha") == encoded
+
+
+def test_legacy_sha256_is_rehashed_on_login(service, pool):
+    service.register_user("asha", "placeholder")
+    legacy = hashlib.sha256(b"s3cret").hexdigest()
+    set_password(pool, "asha", legacy)
+    assert not service.hasher.is_current(legacy)
+
+    assert service.authenticate("asha", "wrong") is None
+    assert stored_password(pool, "asha") == legacy
+
+    assert service.authenticate("asha", "s3cret") is not None
+    upgraded = stored_password(pool, "asha")
+    assert upgraded != legacy and service.hasher.is_current(upgraded)
+    assert service.authenticate("asha", "s3cret") is not None
+
+
+def test_outdated_scheme_is_rehashed_on_login(service, pool):
+    service.register_user("asha", "placeholder")
+    set_password(pool, "asha", FAST_HASHERS[1].encode("s3cret"))
+    assert service.authenticate("asha", "s3cret") is not None
+    assert service.hasher.is_current(stored_password(pool, "asha"))
+
+
+def test_rehash_does_not_overwrite_a_concurrent_change(service, pool):
+    service.register_user("asha", "s3cret")
+    user_id = service.authenticate("asha", "s3cret")[0]
+    legacy = hashlib.sha256(b"s3cret").hexdigest()
+    # The password changed between the login's read and its rehash
+    changed = service.hasher.encode("new password")
+    set_password(pool, "asha", changed)
+    service._rehash(user_id, legacy, "s3cret")
+    assert stored_password(pool, "asha") == changed
+
+
+def test_saturated_slots_raise_auth_busy(pool):
+    service = auth.AuthService(pool, hasher=FAST_HASHERS[0], max_pending=1, wait_timeout=0.05)
+    try:
+        service.register_user("asha", "s3cret")
+        assert service._slots.acquire(blocking=False)
+        try:
+            with pytest.raises(auth.AuthBusy):
+                service.authenticate("asha", "s3cret")
+        finally:
+            service._slots.release()
+        assert service.authenticate("asha", "s3cret") is not None
+    finally:
+        service.close()
+
+
+def test_logout_revokes_the_token(service):
+    service.register_user("asha", "s3cret")
+    service.register_user("ravi", "s3cret")
+    token = service.login("asha", "s3cret")
+    other = service.login("ravi", "s3cret")
+    service.logout(token)
+    assert service.current_user(token) is None
+    assert service.current_user(other) is not None
+
+
+# Session tokens
+def test_tampered_token_is_rejected():
+    tokens = auth.SessionTokens(secret="test")
+    token = tokens.issue(1, "asha")
+    payload, signature = token.rsplit(".", 1)
+    forged_payload = "2" + payload[1:]
+    assert tokens.validate(f"{forged_payload}.{signature}") is None
+    assert tokens.validate(f"{payload}.{signature[:-2]}xx") is None
+    assert auth.SessionTokens(secret="other").validate(token) is None
+    for garbage in ("", "a.b", "not-a-token", token + ".extra"):
+        assert tokens.validate(garbage) is None
+
+
+def test_token_survives_restart_with_the_same_secret():
+    token = auth.SessionTokens(secret="test").issue(1, "asha")
+    assert auth.SessionTokens(secret="test").validate(token) == (1, "asha")
+
+
+def test_expired_token_is_rejected():
+    tokens = auth.SessionTokens(secret="test", ttl=-1)
+    token = tokens.issue(1, "asha")
+    assert tokens.validate(token) is None
+    assert auth.SessionTokens(secret="test").validate(token) is None
+
+
+def test_revocation_outlives_a_cache_clear():
+    tokens = auth.SessionTokens(secret="test", max_cached=2)
+    token = tokens.issue(1, "asha")
+    tokens.revoke(token)
+    # Filling the cache clears it; the token must not come back by signature
+    for user_id in range(2, 6):
+        tokens.issue(user_id, "other")
+    assert tokens.validate(token) is None
+
+
+def test_token_revoked_after_it_left_the_cache():
+    tokens = auth.SessionTokens(secret="test", max_cached=2)
+    token = tokens.issue(1, "asha")
+    for user_id in range(2, 6):
+        tokens.issue(user_id, "other")
+    assert token not in tokens._cache
+    tokens.revoke(token)
+    assert tokens.validate(token) is None
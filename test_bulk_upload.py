@@ -0,0 +1,81 @@
+# test_bulk_upload.py
+"""Bulk upload output keeps every input value and flags rows it could not analyze.
+
+    python -m pytest -q test_bulk_upload.py
+"""
+import io
+
+import pandas as pd
+import pytest
+
+import bulk_upload
+import catalog
+import db_setup
+
+
+@pytest.fixture(scope="module")
+def ref(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("bulk") / "bulk.db")
+    db_setup.ensure_db(db_path)
+    conn = db_setup.connect(db_path)
+    try:
+        return catalog.load_catalog(conn)
+    finally:
+        conn.close()
+
+
+def process(ref, text, on_results=None):
+    out = io.StringIO()
+    bulk_upload.process_file(ref, io.StringIO(text), "samples.csv", out, on_results=on_results)
+    return pd.read_csv(io.StringIO(out.getvalue()), dtype=str, keep_default_na=False)
+
+
+def test_statuses_and_original_values(ref):
+    crop_id = sorted(ref.standards)[0]
+    text = (
+        "crop_id,nitrogen,phosphorus,potassium\n"
+        f"{crop_id},10,20,30\n"
+        "999,10,20,30\n"
+        "abc,10,20,30\n"
+        f"{crop_id},-5,20,30\n"
+        f"{crop_id},x,20,30\n"
+        f"{crop_id},,20,30\n"
+    )
+    out = process(ref, text)
+    assert list(out["crop_id"]) == [str(crop_id), "999", "abc"] + [str(crop_id)] * 3
+    assert list(out["nitrogen"]) == ["10", "10", "10", "-5", "x", ""]
+    assert list(out["status"]) == [
+        "ok", "unknown_crop", "unknown_crop", "negative_level", "invalid_level", "invalid_level",
+    ]
+    balances = out[[f"{n}_balance" for n in bulk_upload.LEVEL_COLUMNS] + ["blend_cost"]]
+    assert (balances.iloc[0] != "").all()
+    assert (balances.iloc[1:] == "").all().all()
+
+
+def test_unknown_names_are_kept(ref):
+    crop_id = sorted(ref.standards)[0]
+    soil = ref.soil_names[ref.crops[crop_id]["soil_id"]]
+    text = (
+        "soil_name,crop_name,nitrogen,phosphorus,potassium\n"
+        f"{soil},{ref.crop_name(crop_id)},1,2,3\n"
+        "Moon Dust,Nothing,1,2,3\n"
+    )
+    out = process(ref, text)
+    assert list(out["crop_name"]) == [ref.crop_name(crop_id), "Nothing"]
+    assert list(out["status"]) == ["ok", "unknown_crop"]
+
+
+def test_archive_block_takes_only_ok_rows(ref):
+    crop_id = sorted(ref.standards)[0]
+    text = (
+        "crop_id,nitrogen,phosphorus,potassium,region\n"
+        f"{crop_id},10,20,30,north\n"
+        "999,10,20,30,south\n"
+        f"{crop_id},-1,20,30,east\n"
+    )
+    blocks = []
+    process(ref, text, on_results=lambda results: blocks.append(bulk_upload.archive_block(ref, results)))
+    (block,) = blocks
+    assert list(block["crop_id"]) == [crop_id]
+    assert list(block["region"]) == ["north"]
+    assert list(block["nitrogen"]) == [10]
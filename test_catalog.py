@@ -0,0 +1,88 @@
+# test_catalog.py
+"""Reference-data snapshot: used only when it is current, rebuilt otherwise.
+
+    python -m pytest -q test_catalog.py
+"""
+import json
+
+import pytest
+
+import catalog
+import db_setup
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_path = str(tmp_path / "catalog.db")
+    db_setup.ensure_db(db_path)
+    conn = db_setup.connect(db_path)
+    yield conn, db_path
+    conn.close()
+
+
+def same(a, b):
+    return (a.version, a.soils, a.crops, a.standards) == (b.version, b.soils, b.crops, b.standards)
+
+
+def load_without_db(monkeypatch, conn, db_path):
+    """load_from_snapshot, failing if it has to query the reference tables"""
+    def no_db(_conn):
+        raise AssertionError("snapshot was not used")
+    monkeypatch.setattr(catalog, "load_catalog", no_db)
+    return catalog.load_from_snapshot(conn, db_path)
+
+
+def test_current_snapshot_is_used(conn, monkeypatch):
+    conn, db_path = conn
+    expected = catalog.load_catalog(conn)
+    catalog.load_from_snapshot(conn, db_path)
+    assert same(load_without_db(monkeypatch, conn, db_path), expected)
+
+
+def test_snapshot_is_plain_json(conn):
+    conn, db_path = conn
+    catalog.load_from_snapshot(conn, db_path)
+    with open(catalog.snapshot_path(db_path), encoding="utf-8") as f:
+        payload = json.load(f)
+    assert payload["code"] == catalog.CODE_HASH
+    assert payload["schema"] == db_setup.SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("field, value", [
+    ("version", -1),
+    ("schema", -1),
+    ("code", "0" * 64),
+    ("format", 1),
+])
+def test_stale_snapshot_falls_back_to_db(conn, field, value):
+    conn, db_path = conn
+    path = catalog.snapshot_path(db_path)
+    catalog.load_from_snapshot(conn, db_path)
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    payload[field] = value
+    payload["soils"] = [[999, "Stale Soil"]]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+    loaded = catalog.load_from_snapshot(conn, db_path)
+    assert same(loaded, catalog.load_catalog(conn))
+    # And the snapshot was rewritten
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[field] != value
+
+
+def test_reference_data_change_invalidates_snapshot(conn):
+    conn, db_path = conn
+    catalog.load_from_snapshot(conn, db_path)
+    conn.execute("INSERT INTO soiltypes (soil_name) VALUES ('Peat Soil')")
+    conn.commit()
+    assert "Peat Soil" in catalog.load_from_snapshot(conn, db_path).soil_id_by_name
+
+
+@pytest.mark.parametrize("content", [b"", b"\x80\x04garbage", b'{"format": 2', b"[]", b'{"format": 2}'])
+def test_corrupt_snapshot_falls_back_to_db(conn, content):
+    conn, db_path = conn
+    with open(catalog.snapshot_path(db_path), "wb") as f:
+        f.write(content)
+    assert same(catalog.load_from_snapshot(conn, db_path), catalog.load_catalog(conn))
@@ -0,0 +1,86 @@
+# test_history.py
+"""Write-behind failures: bad data is isolated, an unavailable store is given up on.
+
+    python -m pytest -q test_history.py
+"""
+import sqlite3
+import time
+
+import pytest
+
+import history
+
+
+class FlakyStore:
+    """flush target that rejects items marked bad and can be taken offline"""
+
+    def __init__(self):
+        self.rows = []
+        self.offline = False
+        self.calls = 0
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.offline:
+            raise sqlite3.OperationalError("database is locked")
+        if any(item == "bad" for item in batch):
+            raise sqlite3.IntegrityError("UNIQUE constraint failed")
+        self.rows.extend(batch)
+
+
+@pytest.fixture
+def store():
+    return FlakyStore()
+
+
+def make_queue(store, **kwargs):
+    kwargs.setdefault("retry_delay", 0.01)
+    return history.WriteBehindQueue(store, max_batch=100, flush_interval=60, **kwargs)
+
+
+def test_bad_item_is_split_out(store):
+    q = make_queue(store)
+    items = list(range(10)) + ["bad"] + list(range(10, 20))
+    for item in items:
+        q.put(item)
+    q.close()
+    assert sorted(store.rows) == list(range(20))
+    assert q.stats["dropped"] == 1 and q.stats["written"] == 20
+
+
+def test_locked_store_is_retried_not_split(store):
+    q = make_queue(store, max_retry_seconds=5)
+    store.offline = True
+    for item in range(10):
+        q.put(item)
+    # The flush starts the write, which keeps retrying while the store is locked
+    assert not q.flush(timeout=0.1)
+    store.offline = False
+    assert q.flush(timeout=5)
+    q.close()
+    assert store.rows == list(range(10))
+    assert q.stats["dropped"] == 0 and q.stats["batches"] == 1
+
+
+def test_persistent_lock_drops_after_the_budget(store):
+    q = make_queue(store, max_retry_seconds=0.2)
+    store.offline = True
+    started = time.monotonic()
+    for item in range(10):
+        q.put(item)
+    assert q.flush(timeout=5)
+    assert time.monotonic() - started < 2
+    assert q.stats["dropped"] == 10 and store.rows == []
+
+    # Still failing once the budget is spent: the next batch gets one attempt, not a fresh budget
+    time.sleep(0.2)
+    calls = store.calls
+    q.put(10)
+    assert q.flush(timeout=5)
+    assert store.calls == calls + 1 and q.stats["dropped"] == 11
+
+    # Once the store is back, writes go through again
+    store.offline = False
+    q.put(11)
+    q.close()
+    assert store.rows == [11]
@@ -0,0 +1,109 @@
+# test_parity.py
+"""Batch results must match the scalar engine exactly, and blends the true optimum.
+
+    python -m pytest -q test_parity.py
+    python test_parity.py
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+import batch_analysis
+import catalog
+import db_setup
+import engine
+from catalog import NUTRIENTS
+
+SAMPLES = 20_000
+
+
+@pytest.fixture(scope="module")
+def ref(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("parity") / "parity.db")
+    db_setup.ensure_db(db_path)
+    conn = db_setup.connect(db_path)
+    try:
+        return catalog.load_catalog(conn)
+    finally:
+        conn.close()
+
+
+def random_samples(ref, count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Include crops without a standard and ids outside the table
+    crop_ids = rng.choice(sorted(ref.standards) + [0, 999, -1], count)
+    levels = rng.integers(0, 150, (count, len(NUTRIENTS))).astype(np.float64)
+    # Fractional levels and exact hits on the standard too
+    levels[::3] += rng.random((len(levels[::3]), len(NUTRIENTS)))
+    for row in range(0, count, 7):
+        std = ref.standard_for(int(crop_ids[row]))
+        if std:
+            levels[row] = [std[nutrient] for nutrient in NUTRIENTS]
+    return crop_ids, levels
+
+
+def test_batch_matches_scalar(ref):
+    crop_ids, levels = random_samples(ref, SAMPLES)
+    results = batch_analysis.analyze_batch(ref, crop_ids, levels[:, 0], levels[:, 1], levels[:, 2])
+    columns = {name: results[name].to_numpy() for name in results.columns}
+    amount_names = [name for name in results.columns if name.endswith("_kg") and not name.startswith("blend_")]
+
+    for row in range(SAMPLES):
+        n, p, k = (float(value) for value in levels[row])
+        expected = engine.recommend(ref, int(crop_ids[row]), n, p, k)
+        if expected is None:
+            assert not columns["has_standard"][row]
+            assert all(np.isnan(columns[f"{nutrient}_balance"][row]) for nutrient in NUTRIENTS)
+            continue
+        assert columns["has_standard"][row]
+        for nutrient in NUTRIENTS:
+            assert columns[f"{nutrient}_balance"][row] == expected["balance"][nutrient]
+
+        amounts = {
+            batch_analysis.amount_column(item["product"], item["nutrient"]): item["kg"]
+            for item in expected["inorganic"] + expected["organic"]
+        }
+        for name in amount_names:
+            if name in amounts:
+                assert columns[name][row] == amounts[name], (row, name)
+            else:
+                assert np.isnan(columns[name][row]), (row, name)
+
+
+def brute_force_cost(solver, deficit):
+    """Cheapest cost over every vertex of {x >= 0, content . x >= deficit}"""
+    count = len(NUTRIENTS)
+    columns = np.hstack([solver.content, -np.eye(count)])
+    costs = np.concatenate([solver.prices, np.zeros(count)])
+    best = np.inf
+    for basis in itertools.combinations(range(columns.shape[1]), count):
+        matrix = columns[:, basis]
+        if abs(np.linalg.det(matrix)) < 1e-12:
+            continue
+        values = np.linalg.solve(matrix, deficit)
+        if (values >= -1e-9).all():
+            best = min(best, float(costs[list(basis)] @ values))
+    return best
+
+
+def test_blend_matches_brute_force():
+    import blend_solver
+
+    solver = blend_solver.default_solver()
+    rng = np.random.default_rng(1)
+    deficits = rng.integers(0, 120, (2_000, len(NUTRIENTS))).astype(np.float64)
+    deficits[::5, rng.integers(0, len(NUTRIENTS))] = 0
+    amounts, cost = solver.solve_batch(deficits)
+
+    content = solver.content @ np.nan_to_num(amounts).T
+    assert (content.T >= deficits - 1e-6).all()
+    for row, deficit in enumerate(deficits):
+        expected = brute_force_cost(solver, deficit)
+        assert cost[row] == pytest.approx(expected, rel=1e-9, abs=1e-6), row
+        scalar = solver.solve(deficit)
+        assert scalar["cost"] == pytest.approx(cost[row], rel=1e-12, abs=1e-9)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,78 @@
+# test_reports.py
+"""Report cache eviction never breaks a download that is already on offer.
+
+    python -m pytest -q test_reports.py
+"""
+import os
+import time
+
+import pytest
+
+import reports
+
+
+def renderer(text, calls):
+    def render(out):
+        calls.append(text)
+        out.write(text)
+    return render
+
+
+def wait_done(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while queue.status(job_id)["state"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return queue.status(job_id)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = reports.ReportQueue(reports.ReportCache(str(tmp_path), max_bytes=100))
+    yield queue
+    queue.shutdown()
+
+
+def test_cache_read_renders_evicted_report_again(tmp_path):
+    cache = reports.ReportCache(str(tmp_path), max_bytes=100)
+    calls = []
+    render = renderer("a" * 60, calls)
+    assert cache.read("a", "txt", render) == b"a" * 60
+    # A second report pushes the cache past max_bytes and evicts the first
+    cache.put("b", "txt", renderer("b" * 60, []))
+    assert cache.get("a", "txt") is None
+    assert cache.read("a", "txt", render) == b"a" * 60
+    assert len(calls) == 2
+
+
+def test_put_keeps_a_report_larger_than_the_cache(tmp_path):
+    cache = reports.ReportCache(str(tmp_path), max_bytes=10)
+    path = cache.put("big", "txt", renderer("x" * 50, []))
+    assert os.path.exists(path)
+
+
+def test_finished_job_survives_eviction(queue):
+    calls = []
+    job_id = queue.submit("a", "txt", renderer("a" * 60, calls))
+    job = wait_done(queue, job_id)
+    assert job["state"] == "done" and "path" not in job
+
+    other = queue.submit("b", "txt", renderer("b" * 60, []))
+    wait_done(queue, other)
+    assert queue.cache.get("a", "txt") is None
+    assert queue.read(job_id) == b"a" * 60
+    assert len(calls) == 2
+
+
+def test_cached_job_reads_without_rendering(queue):
+    calls = []
+    queue.cache.put("a", "txt", renderer("cached", []))
+    job_id = queue.submit("a", "txt", renderer("fresh", calls))
+    assert queue.status(job_id)["state"] == "done"
+    assert queue.read(job_id) == b"cached"
+    assert calls == []
+
+
+def test_unfinished_or_unknown_job_cannot_be_read(queue):
+    with pytest.raises(reports.ReportError):
+        queue.read("missing")
@@ -0,0 +1,67 @@
+# test_service.py
+"""Request validation for the HTTP service.
+
+    python -m pytest -q test_service.py
+"""
+import json
+
+import pytest
+
+import catalog
+import db_setup
+import service
+
+
+@pytest.fixture(scope="module")
+def ref(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("service") / "service.db")
+    db_setup.ensure_db(db_path)
+    conn = db_setup.connect(db_path)
+    try:
+        return catalog.load_catalog(conn)
+    finally:
+        conn.close()
+
+
+def sample(**overrides):
+    item = {"crop_id": 1, "nitrogen": 10, "phosphorus": 20, "potassium": 30}
+    item.update(overrides)
+    return item
+
+
+@pytest.mark.parametrize("item", [
+    sample(crop_id=2 ** 63),
+    sample(crop_id=-2 ** 63 - 1),
+    sample(crop_id=10 ** 30),
+    sample(crop_id=True),
+    sample(crop_id="1"),
+    sample(nitrogen=10 ** 400),
+    sample(phosphorus=-1),
+    sample(potassium=float("inf")),
+    sample(nitrogen=None),
+])
+def test_parse_sample_rejects_out_of_range(item):
+    with pytest.raises(service.BadRequest):
+        service.parse_sample(item)
+
+
+def test_parse_sample_accepts_int64_bounds():
+    assert service.parse_sample(sample(crop_id=2 ** 63 - 1))[0] == 2 ** 63 - 1
+    assert service.parse_sample(sample(crop_id=-2 ** 63))[0] == -2 ** 63
+
+
+@pytest.mark.parametrize("crop_id", [2 ** 63, 10 ** 30])
+def test_batch_rejects_huge_crop_id_with_400(ref, crop_id):
+    body = json.dumps({"samples": [sample(), sample(crop_id=crop_id)]}).encode()
+    response = service.batch_recommendations(ref, body)
+    assert response.status_code == 400
+    assert b"crop_id" in response.body
+
+
+def test_batch_unknown_crop_ids_are_per_sample_errors(ref):
+    body = json.dumps({"samples": [sample(), sample(crop_id=2 ** 63 - 1), sample(crop_id=-1)]}).encode()
+    response = service.batch_recommendations(ref, body)
+    assert response.status_code == 200
+    results = json.loads(response.body)["results"]
+    assert "standard" in results[0]
+    assert [item.get("error") is not None for item in results] == [False, True, True]